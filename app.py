@@ -1,19 +1,35 @@
-import json, os, base64, sys, uuid, jwt, secrets, string, zipfile, io
+import json, os, base64, sys, uuid, jwt, secrets, string, time, random, threading
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, request, jsonify, send_from_directory, render_template, send_file
+from flask import Flask, request, jsonify, send_from_directory, render_template, send_file, Response, g
 from flask_cors import CORS
-from flask_mail import Mail, Message
-from werkzeug.security import generate_password_hash, check_password_hash
-from cryptography.hazmat.primitives.asymmetric import ed25519
-from cryptography.hazmat.primitives import serialization
+from werkzeug.security import generate_password_hash
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 from pymongo.server_api import ServerApi
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle
+from diploma_pdf import render_diploma_pdf, RenderPool
+from pdf_store import PdfStore, LocalPdfStore, GridFSPdfStore, pdf_key
+from revocation_index import RevocationIndex
+from token_cache import TokenCache
+from request_log import configure_logging
+from static_assets import StaticManifest
+from metrics import REGISTRY as metrics, MongoCommandMetrics
+from schema import ensure_indexes, audit_queries
+from zip_stream import stream_zip, file_chunks, attachment_headers
+from jobs import JobQueue
+from bulk_ingest import BulkUpload, BulkFileError, MissingColumnsError, REQUIRED_COLUMNS as BULK_REQUIRED_COLUMNS, chunked, row_fingerprint
+from idempotency import IdempotencyStore, MAX_KEY_LENGTH as IDEMPOTENCY_KEY_MAX_LENGTH, request_hash
+from passwords import PasswordHasher, PasswordVerifier, LoginOverloaded, activation_token_hash
+from outbox import Outbox
+from serving import CpuOffload, cpu_executor
+
+# -----------------------------
+# LOGGING
+# -----------------------------
+# JSON lines written to stdout by a background thread, for this file and every module logger
+# LOG_REQUEST_DEBUG: per-request routing details, for debugging only
+LOG_REQUEST_DEBUG = os.getenv('LOG_REQUEST_DEBUG', 'False') == 'True'
+logger = configure_logging('DEBUG' if LOG_REQUEST_DEBUG else os.getenv('LOG_LEVEL', 'INFO'))
 
 SECRET = os.getenv('JWT_SECRET')
 MONGO_URI = os.getenv('MONGO_URI')
@@ -21,10 +37,10 @@ ALLOWED_ORIGIN = os.getenv('ALLOWED_ORIGIN', '*')
 
 # Validate required environment variables
 if not SECRET:
-    print("ERROR: JWT_SECRET environment variable is not set!")
+    logger.critical("JWT_SECRET environment variable is not set!")
     sys.exit(1)
 if not MONGO_URI:
-    print("ERROR: MONGO_URI environment variable is not set!")
+    logger.critical("MONGO_URI environment variable is not set!")
     sys.exit(1)
 
 # Don't use static_url_path='' as it conflicts with React Router
@@ -51,12 +67,7 @@ def not_found_error(error):
         'timestamp': datetime.utcnow().isoformat()
     }
     
-    # Log to server console
-    print("\n" + "="*80)
-    print("❌ 404 ERROR DETAILS:")
-    for key, value in error_info.items():
-        print(f"  {key}: {value}")
-    print("="*80 + "\n")
+    logger.warning("not found", extra={"fields": error_info})
     
     # Return JSON for API requests, HTML for browser requests
     if request.path.startswith('/api/') or request.accept_mimetypes.accept_json:
@@ -104,23 +115,56 @@ def internal_error(error):
         'method': request.method,
         'timestamp': datetime.utcnow().isoformat()
     }
-    print("\n" + "="*80)
-    print("❌ 500 ERROR:", str(error))
-    print("="*80 + "\n")
+    logger.error("internal error", extra={"fields": error_info})
     return jsonify(error_info), 500
 
 # -----------------------------
 # REQUEST LOGGING MIDDLEWARE
 # -----------------------------
+# LOG_SAMPLE_RATE: share of requests logged (errors always are)
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+
 @app.before_request
-def log_request():
-    """Log all incoming requests before routing"""
-    print("\n" + "🔵"*40, flush=True)
-    print(f"📨 INCOMING REQUEST: {request.method} {request.path}", flush=True)
-    print(f"   Full URL: {request.url}", flush=True)
-    print(f"   Endpoint will be: {request.endpoint if hasattr(request, 'endpoint') else 'unknown'}", flush=True)
-    print("🔵"*40 + "\n", flush=True)
-    sys.stdout.flush()
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def log_request(response):
+    """Log one structured record per request, with its duration"""
+    if response.status_code >= 500 or random.random() < LOG_SAMPLE_RATE:
+        started = g.get("request_started")
+        logger.info("request", extra={"fields": {
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2) if started else None,
+            "bytes": response.content_length,
+            "sample_rate": LOG_SAMPLE_RATE
+        }})
+    return response
+
+# -----------------------------
+# METRICS
+# -----------------------------
+# Exposed by /metrics in Prometheus format, summed over all gunicorn workers
+metrics.counter("http_requests_total", "HTTP requests by endpoint, method and status")
+metrics.histogram("http_request_duration_seconds", "HTTP request latency by endpoint and method")
+metrics.histogram("pdf_render_seconds", "Diploma PDF render time (inline or on the render pool)")
+metrics.histogram("diploma_sign_seconds", "Ed25519 signing time per diploma",
+                  buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+metrics.histogram("smtp_send_seconds", "SMTP send time per email by status")
+metrics.histogram("mongo_command_seconds", "MongoDB command time by command, collection and status")
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started:
+        # Endpoint names, not paths, to keep the number of series bounded
+        labels = {"endpoint": request.endpoint or "unmatched", "method": request.method}
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, labels)
+        metrics.inc("http_requests_total", {**labels, "status": response.status_code})
+    return response
 
 # Configure Flask-Mail
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -129,41 +173,155 @@ app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True') == 'True'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', os.getenv('MAIL_USERNAME'))
-mail = Mail(app)
+_mail = None
+
+def get_mail():
+    """Flask-Mail extension, imported on first use (only the outbox worker sends mail)."""
+    global _mail
+    if _mail is None:
+        from flask_mail import Mail
+        _mail = Mail(app)
+    return _mail
 
 # -----------------------------
 # MONGODB CONNECTION
 # -----------------------------
-try:
-    # Add connection timeout settings
-    client = MongoClient(
-        MONGO_URI, 
-        server_api=ServerApi('1'),
-        serverSelectionTimeoutMS=5000,  # 5 second timeout
-        connectTimeoutMS=5000,
-        socketTimeoutMS=5000
-    )
-    db = client.lowtechdiploma
-    diplomas_collection = db.diplomas
-    users_collection = db.users
-    keys_collection = db.keys
-    
-    # Test connection with timeout
-    client.admin.command('ping')
-    print("Successfully connected to MongoDB!")
-    
+# Add connection timeout settings
+MONGO_OPTIONS = dict(
+    server_api=ServerApi('1'),
+    serverSelectionTimeoutMS=5000,  # 5 second timeout
+    connectTimeoutMS=5000,
+    socketTimeoutMS=5000
+)
+# Nothing is sent before the first query: importing the app has no side effects
+# and a preloading gunicorn master never hands open sockets to its workers
+client = MongoClient(
+    MONGO_URI,
+    connect=False,
+    # With the gevent worker every in-flight request may hold a connection
+    maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+    event_listeners=[MongoCommandMetrics(metrics)],
+    **MONGO_OPTIONS
+)
+db = client.lowtechdiploma
+diplomas_collection = db.diplomas
+users_collection = db.users
+keys_collection = db.keys
+jobs_collection = db.jobs
+outbox_collection = db.outbox
+fingerprints_collection = db.fingerprints
+idempotency_collection = db.idempotency_keys
+
+# -----------------------------
+# STARTUP
+# -----------------------------
+# How long startup() keeps retrying while MongoDB is unreachable
+STARTUP_TIMEOUT_SECONDS = float(os.getenv('STARTUP_TIMEOUT_SECONDS', 120))
+
+# Set by startup()
+PRIVATE_KEY = PUBLIC_KEY = None
+_startup_done = False
+_startup_lock = threading.Lock()
+
+def prepare_database(database):
+    """Check the connection, create the indexes and the default users."""
+    database.client.admin.command('ping')
+    logger.info("connected to MongoDB")
+
+    # Make sure the hot lookups are backed by indexes
+    ensure_indexes(database)
+
     # Initialize default users if collection is empty
-    if users_collection.count_documents({}) == 0:
-        print("Initializing default users...")
-        users_collection.insert_many([
+    if database.users.count_documents({}) == 0:
+        database.users.insert_many([
             {"username": "school", "password": generate_password_hash("schoolpass"), "role": "school"},
             {"username": "alice", "password": generate_password_hash("alicepass"), "role": "student"}
         ])
-        print("Default users created with hashed passwords!")
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
-    print("Please check your MONGO_URI environment variable and MongoDB Atlas network settings")
-    sys.exit(1)
+        logger.info("default users created")
+
+def startup(timeout=STARTUP_TIMEOUT_SECONDS):
+    """Prepare the database and load the signing keys, once per process.
+
+    MongoDB errors are retried with exponential backoff for ``timeout``
+    seconds, then raised. Under ``gunicorn --preload`` this runs in the master
+    (see create_app) and every worker inherits the keys.
+    """
+    global PRIVATE_KEY, PUBLIC_KEY, _startup_done
+    with _startup_lock:
+        if _startup_done:
+            return
+        deadline = time.monotonic() + timeout
+        delay = 1
+        while True:
+            # Short-lived client: the shared one stays unconnected until a worker uses it
+            startup_client = MongoClient(MONGO_URI, **MONGO_OPTIONS)
+            try:
+                prepare_database(startup_client.lowtechdiploma)
+                PRIVATE_KEY, PUBLIC_KEY = load_or_generate_keys(startup_client.lowtechdiploma.keys)
+                break
+            except PyMongoError as e:
+                if time.monotonic() + delay > deadline:
+                    logger.critical("MongoDB unreachable, check MONGO_URI and the MongoDB Atlas network settings",
+                                    extra={"fields": {"error": str(e)}})
+                    raise
+                logger.warning("MongoDB not reachable yet", extra={"fields": {"error": str(e), "retry_in_s": delay}})
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                startup_client.close()
+        _startup_done = True
+
+@app.before_request
+def ensure_startup():
+    # Without --preload, each worker finishes starting on its first request
+    if _startup_done or request.endpoint == "serve_react":
+        return None
+    try:
+        startup(timeout=0)
+    except PyMongoError as e:
+        logger.error("failed to connect to MongoDB", extra={"fields": {"error": str(e)}})
+        response = jsonify({"error": "Database unavailable, retry shortly"})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    return None
+
+def create_app():
+    """Application factory: ``gunicorn 'app:create_app()' --preload``.
+
+    Runs startup() and loads what requests would otherwise load lazily
+    (ReportLab and the compiled diploma templates, Flask-Mail), so workers
+    forked from a preloading master share it copy-on-write and serve their
+    first request immediately.
+    """
+    startup()
+    for template in get_template_registry().templates.values():
+        template.compiled()
+    get_mail()
+    return app
+
+
+# -----------------------------
+# EMAIL OUTBOX
+# -----------------------------
+# Emails are persisted in MongoDB and delivered by a background worker, one SMTP session per batch
+outbox = Outbox(
+    outbox_collection,
+    get_mail,
+    context_factory=app.app_context,
+    rate_per_minute=int(os.getenv('MAIL_RATE_PER_MINUTE', 60)),
+    batch_size=int(os.getenv('OUTBOX_BATCH_SIZE', 20)),
+    max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5)),
+    backoff_seconds=int(os.getenv('OUTBOX_BACKOFF_SECONDS', 30)),
+    poll_interval=float(os.getenv('OUTBOX_POLL_SECONDS', 2)),
+    on_send=lambda seconds, status: metrics.observe("smtp_send_seconds", seconds, {"status": status}),
+    # MAIL_RATE_PER_MINUTE holds for all workers together
+    rate_collection=db.outbox_rate
+)
+
+@app.before_request
+def start_outbox_worker():
+    # Messages left pending by a previous run are delivered once the worker serves traffic
+    outbox.ensure_started()
 
 # -----------------------------
 # BASE PATHS (✅ CORRECT)
@@ -171,18 +329,20 @@ except Exception as e:
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
 DIPLOMAS_DIR = os.path.join(script_dir, "diplomas")
-PDFS_DIR = os.path.join(script_dir, "pdfs")
+PDFS_DIR = os.getenv('PDFS_DIR', os.path.join(script_dir, "pdfs"))
 
 # -----------------------------
 # LOAD OR GENERATE KEYS FROM MONGODB
 # -----------------------------
-def load_or_generate_keys():
+def load_or_generate_keys(keys):
     """Load keys from MongoDB or generate new ones if they don't exist"""
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+    from cryptography.hazmat.primitives import serialization
+
     # Try to load existing keys from MongoDB
-    key_doc = keys_collection.find_one({"key_id": "main"})
+    key_doc = keys.find_one({"key_id": "main"})
     
     if key_doc:
-        print("Loading existing keys from MongoDB...")
         # Load keys from database
         private_key_pem = key_doc["private_key"].encode()
         public_key_pem = key_doc["public_key"].encode()
@@ -190,10 +350,9 @@ def load_or_generate_keys():
         private_key = serialization.load_pem_private_key(private_key_pem, password=None)
         public_key = serialization.load_pem_public_key(public_key_pem)
         
-        print("Keys loaded successfully from MongoDB!")
+        logger.info("signing keys loaded from MongoDB")
         return private_key, public_key
     else:
-        print("No keys found in MongoDB. Generating new keys...")
         # Generate new keys
         private_key = ed25519.Ed25519PrivateKey.generate()
         public_key = private_key.public_key()
@@ -211,105 +370,166 @@ def load_or_generate_keys():
         ).decode()
         
         # Store keys in MongoDB
-        keys_collection.insert_one({
+        keys.insert_one({
             "key_id": "main",
             "private_key": private_key_pem,
             "public_key": public_key_pem,
             "created_at": datetime.utcnow().isoformat() + "Z"
         })
         
-        print("Keys generated and stored in MongoDB successfully!")
+        logger.info("no signing keys in MongoDB, new keys generated and stored")
         return private_key, public_key
 
-PRIVATE_KEY, PUBLIC_KEY = load_or_generate_keys()
-
 os.makedirs(DIPLOMAS_DIR, exist_ok=True)
-os.makedirs(PDFS_DIR, exist_ok=True)
 
 # -----------------------------
 # GENERATE PDF DIPLOMA
 # -----------------------------
+# Under the gevent worker, CPU-bound calls run on native threads instead of the event loop
+cpu_offload = CpuOffload(max_workers=int(os.getenv('CPU_OFFLOAD_THREADS', 0)) or None)
+
+# PDFs are content-addressed: local LRU cache, optionally backed by GridFS (PDF_STORE=gridfs)
+pdf_store = PdfStore(
+    LocalPdfStore(PDFS_DIR, max_bytes=int(os.getenv('PDF_CACHE_MAX_MB', 512)) * 1024 * 1024),
+    render=lambda diploma: render_pdf_inline(diploma),
+    shared=GridFSPdfStore(db) if os.getenv('PDF_STORE', 'local') == 'gridfs' else None
+)
+
+def get_template_registry():
+    # ReportLab is imported with the templates, on first use
+    from diploma_templates import get_registry
+    return get_registry()
+
+def render_pdf_inline(diploma):
+    with metrics.timer("pdf_render_seconds", {"mode": "inline"}):
+        return cpu_offload.run(render_diploma_pdf, diploma)
+
 def generate_diploma_pdf(diploma):
-    """Generate a professional PDF diploma."""
-    pdf_filename = f"{diploma['id']}.pdf"
-    pdf_path = os.path.join(PDFS_DIR, pdf_filename)
-    
-    # Create PDF
-    c = canvas.Canvas(pdf_path, pagesize=A4)
-    width, height = A4
-    
-    # Draw border
-    c.setStrokeColor(colors.HexColor('#1a472a'))
-    c.setLineWidth(3)
-    c.rect(2*cm, 2*cm, width - 4*cm, height - 4*cm)
-    
-    # Inner decorative border
-    c.setLineWidth(1)
-    c.rect(2.3*cm, 2.3*cm, width - 4.6*cm, height - 4.6*cm)
-    
-    # Title
-    c.setFont("Helvetica-Bold", 32)
-    c.setFillColor(colors.HexColor('#1a472a'))
-    c.drawCentredString(width / 2, height - 5*cm, "DIPLÔME")
-    
-    # Subtitle
-    c.setFont("Helvetica", 14)
-    c.setFillColor(colors.black)
-    c.drawCentredString(width / 2, height - 6.5*cm, "Ce document certifie que")
-    
-    # Student name
-    c.setFont("Helvetica-Bold", 24)
-    c.setFillColor(colors.HexColor('#2e7d32'))
-    c.drawCentredString(width / 2, height - 9*cm, diploma['student_name'])
-    
-    # Achievement text
-    c.setFont("Helvetica", 14)
-    c.setFillColor(colors.black)
-    c.drawCentredString(width / 2, height - 11*cm, "a obtenu avec succès le diplôme de")
-    
-    # Degree name
-    c.setFont("Helvetica-Bold", 18)
-    c.setFillColor(colors.HexColor('#1a472a'))
-    c.drawCentredString(width / 2, height - 13*cm, diploma['degree_name'])
-    
-    # Date
-    issue_date = datetime.fromisoformat(diploma['issued_at'].replace('Z', '+00:00'))
-    # French month names
-    months_fr = ['', 'janvier', 'février', 'mars', 'avril', 'mai', 'juin', 
-                 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
-    date_str = f"{issue_date.day} {months_fr[issue_date.month]} {issue_date.year}"
-    c.setFont("Helvetica", 12)
-    c.setFillColor(colors.black)
-    c.drawCentredString(width / 2, height - 16*cm, f"Délivré le {date_str}")
-    
-    # Diploma ID (small text at bottom)
-    c.setFont("Helvetica", 8)
-    c.setFillColor(colors.grey)
-    c.drawCentredString(width / 2, 3*cm, f"ID: {diploma['id']}")
-    
-    # Signature section
-    c.setFont("Helvetica-Oblique", 10)
-    c.setFillColor(colors.black)
-    c.drawString(width - 10*cm, 5*cm, "Signature de l'etablissement")
-    c.line(width - 10*cm, 4.7*cm, width - 3*cm, 4.7*cm)
-    
-    # Low-Tech Diploma watermark
-    c.setFont("Helvetica-BoldOblique", 40)
-    c.setFillColor(colors.Color(0.9, 0.9, 0.9, alpha=0.3))
-    c.saveState()
-    c.translate(width / 2, height / 2)
-    c.rotate(45)
-    c.drawCentredString(0, 0, "LOW-TECH DIPLOMA")
-    c.restoreState()
-    
-    # Save PDF
-    c.save()
-    
-    return pdf_path
+    """Return the path of a diploma's PDF, rendering it only if no store has it."""
+    return pdf_store.fetch(diploma)
+
+# Bulk issuance renders PDFs on a process pool sized to the machine's cores
+render_pool = RenderPool(
+    max_workers=int(os.getenv('PDF_RENDER_WORKERS', 0)) or None,
+    max_tasks_per_child=int(os.getenv('PDF_RENDER_MAX_TASKS_PER_CHILD', 200)) or None,
+    memory_limit_mb=int(os.getenv('PDF_RENDER_MEMORY_MB', 0)) or None,
+    max_inflight=int(os.getenv('PDF_RENDER_MAX_INFLIGHT', 64)),
+    on_render=lambda seconds: metrics.observe("pdf_render_seconds", seconds, {"mode": "pool"})
+)
+
+# -----------------------------
+# DOWNLOAD LINKS
+# -----------------------------
+# "attachment" sends the PDF with the email, "link" a signed, expiring download URL
+MAIL_PDF_MODE = os.getenv('MAIL_PDF_MODE', 'attachment')
+DOWNLOAD_LINK_TTL_DAYS = int(os.getenv('DOWNLOAD_LINK_TTL_DAYS', 30))
+PUBLIC_URL = os.getenv('PUBLIC_URL', ALLOWED_ORIGIN)
+# Emailed links must be absolute: ALLOWED_ORIGIN may be '*'
+if MAIL_PDF_MODE == 'link' and not os.getenv('PUBLIC_URL'):
+    logger.critical("PUBLIC_URL environment variable must be set when MAIL_PDF_MODE=link!")
+    sys.exit(1)
+# Keeps download tokens and login tokens from being used for one another
+DOWNLOAD_LINK_AUDIENCE = "diploma-download"
+
+def diploma_download_link(diploma):
+    """Signed URL to a diploma's PDF, verifiable without a database lookup."""
+    token = jwt.encode(
+        {
+            "aud": DOWNLOAD_LINK_AUDIENCE,
+            "sub": diploma["id"],
+            "key": pdf_key(diploma),
+            "exp": datetime.utcnow() + timedelta(days=DOWNLOAD_LINK_TTL_DAYS)
+        },
+        SECRET,
+        algorithm="HS256"
+    )
+    return f"{PUBLIC_URL}/dl/{token}"
+
+def diploma_email_pdf(diploma, pdf_path):
+    """Return (attachments, download link) for a diploma email according to MAIL_PDF_MODE."""
+    if MAIL_PDF_MODE == 'link':
+        return [], diploma_download_link(diploma)
+    attachments = []
+    if pdf_path and os.path.exists(pdf_path):
+        with open(pdf_path, 'rb') as fp:
+            attachments.append((f"diplome_{diploma['student_name']}.pdf", "application/pdf", fp.read()))
+    return attachments, None
+
+# -----------------------------
+# STUDENT ACCOUNTS
+# -----------------------------
+# Werkzeug hash method and parameters, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000";
+# older hashes are upgraded at the next successful login
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+
+# New accounts' passwords are hashed on a process pool, in parallel with diploma signing
+password_hasher = PasswordHasher(
+    max_workers=int(os.getenv('PASSWORD_HASH_WORKERS', 0)) or None,
+    method=PASSWORD_HASH_METHOD
+)
+
+# Login checks run on a bounded executor; beyond LOGIN_MAX_PENDING waiting checks, /login answers 503.
+# With threaded workers (GUNICORN_THREADS request threads) waiting logins may hold
+# every thread but one, otherwise a burst of logins still starves the other routes.
+# Under gevent a waiting login only holds a greenlet.
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 4))
+if os.getenv('GUNICORN_WORKER_CLASS', 'gthread') == 'gevent':
+    LOGIN_MAX_PENDING = int(os.getenv('LOGIN_MAX_PENDING', 8))
+else:
+    LOGIN_MAX_PENDING = max(GUNICORN_THREADS - 1, 1)
+    if os.getenv('LOGIN_MAX_PENDING'):
+        LOGIN_MAX_PENDING = min(int(os.getenv('LOGIN_MAX_PENDING')), LOGIN_MAX_PENDING)
+password_verifier = PasswordVerifier(
+    max_workers=int(os.getenv('LOGIN_HASH_THREADS', 1)),
+    max_pending=LOGIN_MAX_PENDING,
+    method=PASSWORD_HASH_METHOD
+)
+LOGIN_RETRY_AFTER_SECONDS = int(os.getenv('LOGIN_RETRY_AFTER_SECONDS', 2))
+
+# "password" emails a generated password; "token" emails a one-time link to choose one,
+# so nothing is hashed at issuance
+ACCOUNT_ACTIVATION = os.getenv('ACCOUNT_ACTIVATION', 'password')
+ACTIVATION_TOKEN_TTL_DAYS = int(os.getenv('ACTIVATION_TOKEN_TTL_DAYS', 30))
+# The activation link is emailed, so it needs an absolute URL too
+if ACCOUNT_ACTIVATION == 'token' and not os.getenv('PUBLIC_URL'):
+    logger.critical("PUBLIC_URL environment variable must be set when ACCOUNT_ACTIVATION=token!")
+    sys.exit(1)
+MIN_PASSWORD_LENGTH = 8
+
+def new_account_secret():
+    """Generated password for a new account, or its activation token in "token" mode."""
+    if ACCOUNT_ACTIVATION == 'token':
+        return secrets.token_urlsafe(32)
+    # Generate a secure random password (12 characters: letters, digits, special chars)
+    alphabet = string.ascii_letters + string.digits + "!@#$%&*"
+    return ''.join(secrets.choice(alphabet) for i in range(12))
+
+def student_account(student_name, student_email, secret, password_hash=None):
+    """User document of a new student account."""
+    user = {"username": student_name, "role": "student", "email": student_email}
+    if ACCOUNT_ACTIVATION == 'token':
+        # Only the token's hash is stored; the account has no password until activation
+        user["password"] = None
+        user["activation"] = {
+            "token_hash": activation_token_hash(secret),
+            "expires_at": datetime.utcnow() + timedelta(days=ACTIVATION_TOKEN_TTL_DAYS)
+        }
+    else:
+        user["password"] = password_hash
+    return user
+
+def account_credentials(secret):
+    """Email line telling a new student how to log in."""
+    if ACCOUNT_ACTIVATION == 'token':
+        return f"Choisissez votre mot de passe (lien valable {ACTIVATION_TOKEN_TTL_DAYS} jours) : {PUBLIC_URL}/activate?token={secret}"
+    return f"Mot de passe: {secret}"
 
 # -----------------------------
 # AUTH DECORATOR
 # -----------------------------
+# Claims of already verified tokens, so repeated calls skip the signature check
+token_cache = TokenCache(max_entries=int(os.getenv('AUTH_CACHE_SIZE', 1024)))
+
 def auth_required(role=None):
     def decorator(f):
         @wraps(f)
@@ -322,12 +542,15 @@ def auth_required(role=None):
             if token.startswith("Bearer "):
                 token = token[7:]  # Remove "Bearer " prefix
             
-            try:
-                decoded = jwt.decode(token, SECRET, algorithms=["HS256"])
-            except jwt.ExpiredSignatureError:
-                return jsonify({"error": "Token has expired"}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({"error": "Invalid token"}), 401
+            decoded = token_cache.get(token)
+            if decoded is None:
+                try:
+                    decoded = jwt.decode(token, SECRET, algorithms=["HS256"])
+                except jwt.ExpiredSignatureError:
+                    return jsonify({"error": "Token has expired"}), 401
+                except jwt.InvalidTokenError:
+                    return jsonify({"error": "Invalid token"}), 401
+                token_cache.put(token, decoded)
 
             if role and decoded.get("role") != role:
                 return jsonify({"error": "Forbidden"}), 403
@@ -337,37 +560,75 @@ def auth_required(role=None):
         return wrapper
     return decorator
 
+# -----------------------------
+# IDEMPOTENCY
+# -----------------------------
+idempotency = IdempotencyStore(idempotency_collection)
+
+def idempotent(f):
+    """Replay the stored response when a request is retried with the same ``Idempotency-Key``."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({"error": f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+
+        owner = request.user["username"]
+        fingerprint = request_hash(request.method, request.path, request.get_data())
+        earlier = idempotency.claim(owner, key, fingerprint)
+        if earlier:
+            if earlier["request_hash"] != fingerprint:
+                return jsonify({"error": "Idempotency-Key already used for a different request"}), 422
+            if earlier["status_code"] is None:
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409, {"Retry-After": "1"}
+            response = jsonify(earlier["response"])
+            response.status_code = earlier["status_code"]
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency.release(owner, key)
+            raise
+        # Server errors are not replayed: the client may retry with the same key
+        if response.status_code >= 500 or not response.is_json:
+            idempotency.release(owner, key)
+        else:
+            idempotency.complete(owner, key, response.status_code, response.get_json())
+        return response
+    return wrapper
+
 # -----------------------------
 # ISSUE
 # -----------------------------
 @app.route("/issue", methods=["POST"])
 @auth_required("school")
+@idempotent
 def issue():
     data = request.json
     student_name = data.get("student_name")
     student_email = data.get("student_email")
+    template = data.get("template")
+
+    if template and template not in get_template_registry().templates:
+        return jsonify({"error": f"Unknown diploma template: {template}"}), 400
 
     # Check if user already exists
     existing_user = users_collection.find_one({"username": student_name})
     account_created = False
     student_password = None
+    password_hash = None
     
     if not existing_user:
-        # Generate a secure random password (12 characters: letters, digits, special chars)
-        alphabet = string.ascii_letters + string.digits + "!@#$%&*"
-        student_password = ''.join(secrets.choice(alphabet) for i in range(12))
-        
-        # Create new student account
-        users_collection.insert_one({
-            "username": student_name,
-            "password": generate_password_hash(student_password),
-            "role": "student",
-            "email": student_email
-        })
-        print(f"New student account created: {student_name} with auto-generated password")
-        account_created = True
+        student_password = new_account_secret()
+        if ACCOUNT_ACTIVATION != 'token':
+            # Hashed on the pool while the diploma is signed
+            password_hash = password_hasher.submit(student_password)
     else:
-        print(f"User {student_name} already exists, skipping account creation")
+        logger.info("student account already exists", extra={"fields": {"username": student_name}})
 
     diploma = {
         "id": str(uuid.uuid4()),
@@ -376,28 +637,53 @@ def issue():
         "issued_at": datetime.utcnow().isoformat() + "Z",
         "revoked": False
     }
+    # The template is part of the signed content so the PDF can be re-rendered identically
+    if template:
+        diploma["template"] = template
 
     payload = json.dumps(diploma, sort_keys=True).encode()
-    signature = PRIVATE_KEY.sign(payload)
+    with metrics.timer("diploma_sign_seconds"):
+        signature = PRIVATE_KEY.sign(payload)
     diploma["signature"] = base64.b64encode(signature).decode()
 
+    if student_password:
+        # Create new student account
+        try:
+            users_collection.insert_one(student_account(
+                student_name, student_email, student_password,
+                password_hash.result() if password_hash else None
+            ))
+            logger.info("student account created", extra={"fields": {
+                "username": student_name, "activation": ACCOUNT_ACTIVATION
+            }})
+            account_created = True
+        except DuplicateKeyError:
+            # A concurrent /issue created the account first: its email carries the credentials
+            logger.info("student account already exists", extra={"fields": {"username": student_name}})
+            student_password = None
+
     # Save to MongoDB
     diplomas_collection.insert_one(diploma)
+    if revocation_index:
+        revocation_index.add(diploma["id"])
 
     # Generate PDF diploma
     pdf_path = None
     try:
         pdf_path = generate_diploma_pdf(diploma)
-        print(f"PDF diploma generated: {pdf_path}")
+        logger.info("PDF diploma generated", extra={"fields": {"diploma_id": diploma["id"], "path": pdf_path}})
     except Exception as e:
-        print(f"Failed to generate PDF: {e}")
+        logger.error("failed to generate PDF", extra={"fields": {"diploma_id": diploma["id"], "error": str(e)}})
 
-    # Send email to student
+    # Queue email to student
     try:
         if app.config['MAIL_USERNAME']:  # Only send if mail is configured
-            msg = Message(
+            attachments, download_link = diploma_email_pdf(diploma, pdf_path)
+            
+            outbox.enqueue(
                 subject=f"Votre diplôme: {data.get('degree_name')}",
                 recipients=[student_email],
+                attachments=attachments,
                 body=f"""Bonjour {student_name},
 
 Félicitations ! Votre diplôme "{data.get('degree_name')}" a été émis avec succès.
@@ -405,206 +691,344 @@ Félicitations ! Votre diplôme "{data.get('degree_name')}" a été émis avec s
 {'Votre compte a été créé. Voici vos identifiants de connexion :' if account_created else 'Vous pouvez vous connecter avec vos identifiants existants :'}
 
 Nom d\'utilisateur: {student_name}
-{('Mot de passe: ' + student_password) if account_created and student_password else ''}
+{account_credentials(student_password) if account_created and student_password else ''}
 
 Connectez-vous sur: {ALLOWED_ORIGIN}/login
 
 Vous pourrez consulter et télécharger votre diplôme dans la section "Mes diplômes".
 
-Veuillez trouver votre diplôme en pièce jointe au format PDF.
+{('Téléchargez votre diplôme au format PDF (lien valable ' + str(DOWNLOAD_LINK_TTL_DAYS) + ' jours) : ' + download_link) if download_link else 'Veuillez trouver votre diplôme en pièce jointe au format PDF.'}
 
 Cordialement,
 L'équipe Low-Tech Diploma
 """
             )
-            
-            # Attach PDF diploma to email
-            if pdf_path and os.path.exists(pdf_path):
-                with open(pdf_path, 'rb') as fp:
-                    msg.attach(
-                        f"diplome_{student_name}.pdf",
-                        "application/pdf",
-                        fp.read()
-                    )
-            
-            mail.send(msg)
-            print(f"Email sent to {student_email}")
-            email_sent = True
+            logger.info("email queued", extra={"fields": {"diploma_id": diploma["id"]}})
+            email_queued = True
         else:
-            print("Mail not configured, skipping email")
-            email_sent = False
+            logger.info("mail not configured, email skipped", extra={"fields": {"diploma_id": diploma["id"]}})
+            email_queued = False
     except Exception as e:
-        print(f"Failed to send email: {e}")
-        email_sent = False
+        logger.error("failed to queue email", extra={"fields": {"diploma_id": diploma["id"], "error": str(e)}})
+        email_queued = False
 
     return jsonify({
         "status": "ok", 
         "diploma_id": diploma["id"], 
         "account_created": account_created,
-        "email_sent": email_sent
+        "email_queued": email_queued,
+        # Former name of email_queued, kept for existing API clients
+        "email_sent": email_queued
     })
 
 # -----------------------------
 # BULK ISSUE
 # -----------------------------
-@app.route("/bulk_issue", methods=["POST"])
-@auth_required("school")
-def bulk_issue():
-    # Lazy import pandas to avoid startup issues
-    try:
-        import pandas as pd
-    except ImportError:
-        return jsonify({"error": "Bulk import feature is not available. pandas library is not installed."}), 503
-    
-    if 'file' not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
-    
-    file = request.files['file']
-    
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
-    
-    # Check file extension
-    if not (file.filename.endswith('.csv') or file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
-        return jsonify({"error": "Only CSV and Excel files are supported"}), 400
-    
+# Bulk uploads run as background jobs so large files never hit the gunicorn timeout
+job_queue = JobQueue(
+    jobs_collection,
+    max_workers=int(os.getenv('BULK_JOB_WORKERS', 2)),
+    context_factory=app.app_context,
+    max_details=int(os.getenv('BULK_JOB_MAX_DETAILS', 1000)),
+    # A job not refreshed for this long lost its worker and is reported as failed
+    lease_seconds=int(os.getenv('BULK_JOB_LEASE_SECONDS', 300))
+)
+
+# Uploads are spooled here until their job has read them (default: system temp dir)
+BULK_UPLOAD_DIR = os.getenv('BULK_UPLOAD_DIR') or None
+
+# Rows are written to MongoDB in chunks of this size with unordered inserts
+BULK_WRITE_CHUNK = int(os.getenv('BULK_WRITE_CHUNK', 500))
+
+# A claimed row whose diploma is still missing after this long was left by an interrupted job
+BULK_CLAIM_TIMEOUT = timedelta(hours=1)
+
+def insert_many_unordered(collection, docs):
+    """Insert docs in unordered chunks and return {doc index: write error} for failures."""
+    failures = {}
+    for start in range(0, len(docs), BULK_WRITE_CHUNK):
+        try:
+            collection.insert_many(docs[start:start + BULK_WRITE_CHUNK], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failures[start + error["index"]] = error
+    return failures
+
+def queue_bulk_diploma_email(diploma, student_email, account_created, student_password, pdf_path):
+    """Queue the bulk issuance email for one diploma and return whether it was queued."""
+    student_name = diploma["student_name"]
+    degree_name = diploma["degree_name"]
     try:
-        # Read file based on extension
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        else:
-            df = pd.read_excel(file)
-        
-        # Validate required columns
-        required_columns = ['student_name', 'student_email', 'degree_name']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            return jsonify({
-                "error": f"Missing required columns: {', '.join(missing_columns)}",
-                "hint": "Required columns: student_name, student_email, degree_name"
-            }), 400
-        
-        results = {
-            "total": 0,
-            "success": 0,
-            "failed": 0,
-            "details": []
-        }
-        
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                student_name = str(row['student_name']).strip()
-                student_email = str(row['student_email']).strip()
-                degree_name = str(row['degree_name']).strip()
-                
-                # Skip empty rows
-                if not student_name or student_name == 'nan':
-                    continue
-                
-                results["total"] += 1
-                
-                # Check if user already exists
-                existing_user = users_collection.find_one({"username": student_name})
-                account_created = False
-                student_password = None
-                
-                if not existing_user:
-                    # Generate password
-                    alphabet = string.ascii_letters + string.digits + "!@#$%&*"
-                    student_password = ''.join(secrets.choice(alphabet) for i in range(12))
-                    
-                    # Create student account
-                    users_collection.insert_one({
-                        "username": student_name,
-                        "password": generate_password_hash(student_password),
-                        "role": "student",
-                        "email": student_email
-                    })
-                    account_created = True
-                
-                # Create diploma
-                diploma = {
-                    "id": str(uuid.uuid4()),
-                    "student_name": student_name,
-                    "degree_name": degree_name,
-                    "issued_at": datetime.utcnow().isoformat() + "Z",
-                    "revoked": False
-                }
-                
-                payload = json.dumps(diploma, sort_keys=True).encode()
-                signature = PRIVATE_KEY.sign(payload)
-                diploma["signature"] = base64.b64encode(signature).decode()
-                
-                # Save to MongoDB
-                diplomas_collection.insert_one(diploma)
-                
-                # Generate PDF
-                pdf_path = None
-                try:
-                    pdf_path = generate_diploma_pdf(diploma)
-                except Exception as e:
-                    print(f"Failed to generate PDF for {student_name}: {e}")
-                
-                # Send email
-                email_sent = False
-                try:
-                    if app.config['MAIL_USERNAME']:
-                        msg = Message(
-                            subject=f"Votre diplome: {degree_name}",
-                            recipients=[student_email],
-                            body=f"""Bonjour {student_name},
+        if app.config['MAIL_USERNAME']:
+            attachments, download_link = diploma_email_pdf(diploma, pdf_path)
+            
+            outbox.enqueue(
+                subject=f"Votre diplome: {degree_name}",
+                recipients=[student_email],
+                attachments=attachments,
+                body=f"""Bonjour {student_name},
 
 Felicitations ! Votre diplome "{degree_name}" a ete emis avec succes.
 
 {'Votre compte a ete cree. Voici vos identifiants de connexion :' if account_created else 'Vous pouvez vous connecter avec vos identifiants existants :'}
 
 Nom d'utilisateur: {student_name}
-{('Mot de passe: ' + student_password) if account_created and student_password else ''}
+{account_credentials(student_password) if account_created and student_password else ''}
 
 Connectez-vous sur: {ALLOWED_ORIGIN}/login
 
-Veuillez trouver votre diplome en piece jointe au format PDF.
+{('Telechargez votre diplome au format PDF (lien valable ' + str(DOWNLOAD_LINK_TTL_DAYS) + ' jours) : ' + download_link) if download_link else 'Veuillez trouver votre diplome en piece jointe au format PDF.'}
 
 Cordialement,
 L'equipe Low-Tech Diploma
 """
-                        )
-                        
-                        if pdf_path and os.path.exists(pdf_path):
-                            with open(pdf_path, 'rb') as fp:
-                                msg.attach(
-                                    f"diplome_{student_name}.pdf",
-                                    "application/pdf",
-                                    fp.read()
-                                )
-                        
-                        mail.send(msg)
-                        email_sent = True
-                except Exception as e:
-                    print(f"Failed to send email to {student_email}: {e}")
-                
-                results["success"] += 1
-                results["details"].append({
-                    "student": student_name,
-                    "status": "success",
-                    "diploma_id": diploma["id"],
-                    "email_sent": email_sent
+            )
+            return True
+    except Exception as e:
+        logger.error("failed to queue email", extra={"fields": {"diploma_id": diploma["id"], "error": str(e)}})
+    return False
+
+def claim_bulk_rows(rows):
+    """Claim the fingerprint of every row that has no active diploma yet.
+
+    Stored fingerprints are fetched with a single ``$in`` query and the new
+    ones inserted in one unordered batch, the unique index settling rows
+    claimed meanwhile by a concurrent upload. Returns ``(rows, diploma_ids,
+    details)``: the rows to issue with the id reserved for their diploma, and
+    the report entries of the others (skipped as already issued, or failed).
+    """
+    fingerprints = [row_fingerprint(row) for row in rows]
+    claims = {
+        claim["fingerprint"]: claim
+        for claim in fingerprints_collection.find({"fingerprint": {"$in": list(set(fingerprints))}}, {"_id": 0})
+    }
+
+    # Revoked diplomas, and claims left behind by an interrupted job, free their row
+    states = diploma_states([claim["diploma_id"] for claim in claims.values()])
+    abandoned_before = datetime.utcnow() - BULK_CLAIM_TIMEOUT
+    stale = [
+        claim["diploma_id"] for claim in claims.values()
+        if states.get(claim["diploma_id"]) or (
+            claim["diploma_id"] not in states and claim["claimed_at"] < abandoned_before)
+    ]
+    if stale:
+        fingerprints_collection.delete_many({"diploma_id": {"$in": stale}})
+        claims = {fingerprint: claim for fingerprint, claim in claims.items() if claim["diploma_id"] not in stale}
+
+    details = []
+    claimed = []
+    new_claims = []
+    for row, fingerprint in zip(rows, fingerprints):
+        if fingerprint in claims:
+            # Issued by an earlier upload, or repeated in this file
+            details.append({
+                "student": row["student_name"],
+                "status": "skipped",
+                "diploma_id": claims[fingerprint]["diploma_id"]
+            })
+            continue
+        claims[fingerprint] = {
+            "fingerprint": fingerprint,
+            "diploma_id": str(uuid.uuid4()),
+            "claimed_at": datetime.utcnow()
+        }
+        claimed.append(row)
+        new_claims.append(claims[fingerprint])
+
+    claim_failures = insert_many_unordered(fingerprints_collection, new_claims)
+    for index, error in claim_failures.items():
+        entry = {"student": claimed[index]["student_name"], "status": "skipped"}
+        if error.get("code") != 11000:
+            entry.update(status="failed", error=error.get("errmsg", "fingerprint insert failed"))
+        details.append(entry)
+
+    kept = [index for index in range(len(claimed)) if index not in claim_failures]
+    return [claimed[index] for index in kept], [new_claims[index]["diploma_id"] for index in kept], details
+
+def create_bulk_diplomas(rows, report):
+    """Create accounts and signed diplomas for bulk rows using batched MongoDB round-trips.
+
+    Rows are consumed chunk by chunk as they are read from the upload. Rows
+    issued by an earlier upload are skipped (see ``claim_bulk_rows``), the
+    student names of the others are resolved with a single ``$in`` query,
+    then accounts and diplomas are created with unordered ``insert_many``
+    calls. Rows that fail are reported straight away; stored diplomas are
+    yielded as ``(diploma, row, student_password)``.
+    """
+    templates = set(get_template_registry().templates)
+
+    for rows_chunk in chunked(rows, BULK_WRITE_CHUNK):
+        failures = []
+        chunk = []
+        for row in rows_chunk:
+            if row.get("template") and row["template"] not in templates:
+                failures.append({
+                    "student": row["student_name"],
+                    "status": "failed",
+                    "error": f"Unknown diploma template: {row['template']}"
                 })
-                
-            except Exception as e:
-                results["failed"] += 1
-                results["details"].append({
-                    "student": str(row.get('student_name', f'Row {index + 1}')),
+            else:
+                chunk.append(row)
+        chunk, diploma_ids, unclaimed = claim_bulk_rows(chunk)
+        failures.extend(unclaimed)
+
+        names = list({row["student_name"] for row in chunk})
+        known_users = {
+            user["username"]
+            for user in users_collection.find({"username": {"$in": names}}, {"username": 1, "_id": 0})
+        }
+
+        # Missing accounts (once per student name); their passwords are hashed
+        # on the pool while the chunk's diplomas are signed below
+        passwords = {}
+        new_accounts = []
+        for row in chunk:
+            student_name = row["student_name"]
+            if student_name in known_users or student_name in passwords:
+                continue
+            passwords[student_name] = new_account_secret()
+            new_accounts.append(row)
+        if ACCOUNT_ACTIVATION != 'token':
+            password_hashes = password_hasher.map(passwords[row["student_name"]] for row in new_accounts)
+        else:
+            password_hashes = [None] * len(new_accounts)
+
+        # Sign diplomas for every row
+        diplomas = []
+        for row, diploma_id in zip(chunk, diploma_ids):
+            diploma = {
+                "id": diploma_id,
+                "student_name": row["student_name"],
+                "degree_name": row["degree_name"],
+                "issued_at": datetime.utcnow().isoformat() + "Z",
+                "revoked": False
+            }
+            if row.get("template"):
+                diploma["template"] = row["template"]
+            payload = json.dumps(diploma, sort_keys=True).encode()
+            with metrics.timer("diploma_sign_seconds"):
+                signature = PRIVATE_KEY.sign(payload)
+            diploma["signature"] = base64.b64encode(signature).decode()
+            diplomas.append(diploma)
+
+        user_docs = [
+            student_account(row["student_name"], row["student_email"], passwords[row["student_name"]], password_hash)
+            for row, password_hash in zip(new_accounts, password_hashes)
+        ]
+        failed_accounts = {}
+        for index, error in insert_many_unordered(users_collection, user_docs).items():
+            student_name = user_docs[index]["username"]
+            del passwords[student_name]
+            # A duplicate key means the account appeared meanwhile: keep issuing
+            if error.get("code") != 11000:
+                failed_accounts[student_name] = error.get("errmsg", "account creation failed")
+
+        # Keep the diplomas of every row whose account is usable
+        signed = diplomas
+        diplomas = []
+        diploma_rows = []
+        released = []
+        for row, diploma in zip(chunk, signed):
+            if row["student_name"] in failed_accounts:
+                failures.append({
+                    "student": row["student_name"],
                     "status": "failed",
-                    "error": str(e)
+                    "error": failed_accounts[row["student_name"]]
                 })
-        
-        return jsonify(results)
-        
-    except Exception as e:
-        return jsonify({"error": f"Failed to process file: {str(e)}"}), 500
+                released.append(diploma["id"])
+                continue
+            diplomas.append(diploma)
+            diploma_rows.append(row)
+
+        diploma_failures = insert_many_unordered(diplomas_collection, diplomas)
+        for index, error in diploma_failures.items():
+            failures.append({
+                "student": diploma_rows[index]["student_name"],
+                "status": "failed",
+                "error": error.get("errmsg", "diploma insert failed")
+            })
+            released.append(diplomas[index]["id"])
+        # Failed rows are issued again by the next upload of the file
+        if released:
+            fingerprints_collection.delete_many({"diploma_id": {"$in": released}})
+        report(failures)
+
+        for index, (diploma, row) in enumerate(zip(diplomas, diploma_rows)):
+            if index in diploma_failures:
+                continue
+            diploma.pop("_id", None)
+            if revocation_index:
+                revocation_index.add(diploma["id"])
+            # Only the first diploma of a new account carries its password
+            yield diploma, row, passwords.pop(row["student_name"], None)
+
+def issue_bulk_rows(rows, report):
+    """Issue diplomas for all bulk upload rows.
+
+    Diplomas are created lazily as the render pool asks for more work, so
+    MongoDB writes, PDF rendering (on every core) and emails overlap.
+    """
+    stored = create_bulk_diplomas(rows, report)
+    for (diploma, row, student_password), pdf_data, error in render_pool.render_many(stored, key=lambda item: item[0]):
+        pdf_path = None
+        if error:
+            logger.error("failed to generate PDF", extra={"fields": {"diploma_id": diploma["id"], "error": str(error)}})
+        else:
+            pdf_path = pdf_store.put(diploma, pdf_data)
+
+        email_queued = queue_bulk_diploma_email(
+            diploma, row["student_email"], student_password is not None, student_password, pdf_path
+        )
+
+        report([{
+            "student": row["student_name"],
+            "status": "success",
+            "diploma_id": diploma["id"],
+            "email_queued": email_queued,
+            "email_sent": email_queued
+        }])
+
+@app.route("/bulk_issue", methods=["POST"])
+@auth_required("school")
+def bulk_issue():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
+    
+    # Only the header is read here; rows are streamed from disk by the job
+    try:
+        upload = BulkUpload.save(file, BULK_UPLOAD_DIR)
+    except MissingColumnsError as e:
+        return jsonify({
+            "error": str(e),
+            "hint": f"Required columns: {', '.join(BULK_REQUIRED_COLUMNS)}"
+        }), 400
+    except BulkFileError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Read before submitting: a fast job may already have deleted the file
+    size = os.path.getsize(upload.path)
+    job_id = job_queue.submit("bulk_issue", upload, issue_bulk_rows, owner=request.user["username"])
+    logger.info("bulk issuance job queued", extra={"fields": {"job_id": job_id, "bytes": size}})
+    
+    return jsonify({"status": "queued", "job_id": job_id}), 202
+
+# -----------------------------
+# JOBS
+# -----------------------------
+@app.route("/jobs/<job_id>", methods=["GET"])
+@auth_required("school")
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    
+    if not job:
+        return jsonify({"error": "unknown job"}), 404
+    
+    return jsonify(job)
 
 # -----------------------------
 # GET DIPLOMA
@@ -634,30 +1058,138 @@ def get_diploma(id):
 # -----------------------------
 # VERIFY
 # -----------------------------
+# Issued/revoked ids are kept in memory and synchronised from the diplomas collection
+revocation_index = RevocationIndex(
+    diplomas_collection,
+    poll_interval=float(os.getenv('REVOCATION_POLL_SECONDS', 5))
+) if os.getenv('REVOCATION_INDEX', 'True') == 'True' else None
+# Confirm ids unknown to the index with the database (they may have just been issued elsewhere)
+REVOCATION_INDEX_CONFIRM_UNKNOWN = os.getenv('REVOCATION_INDEX_CONFIRM_UNKNOWN', 'True') == 'True'
+
+def check_signature(diploma):
+    """Return None if the diploma's Ed25519 signature is valid, else the failure reason."""
+    try:
+        signature = base64.b64decode(diploma["signature"])
+        unsigned = diploma.copy()
+        del unsigned["signature"]
+        payload = json.dumps(unsigned, sort_keys=True).encode()
+    except Exception:
+        return "malformed diploma"
+
+    try:
+        PUBLIC_KEY.verify(signature, payload)
+        return None
+    except Exception:
+        return "invalid signature"
+
+def diploma_states(ids):
+    """Map each known diploma id to its revoked flag.
+
+    Answered from the in-memory revocation index when possible. Ids it cannot
+    vouch for (index still loading, or diploma issued by another worker a
+    moment ago) are resolved with a single ``$in`` query.
+    """
+    states = {}
+    missing = []
+    for diploma_id in ids:
+        if not isinstance(diploma_id, str):
+            continue
+        status = revocation_index.status(diploma_id) if revocation_index else None
+        if status == "valid":
+            states[diploma_id] = False
+        elif status == "revoked":
+            states[diploma_id] = True
+        elif status is None or REVOCATION_INDEX_CONFIRM_UNKNOWN:
+            missing.append(diploma_id)
+
+    if missing:
+        for doc in diplomas_collection.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "revoked": 1}):
+            states[doc["id"]] = doc.get("revoked", False)
+            if revocation_index and revocation_index.ready:
+                revocation_index.add(doc["id"], revoked=doc.get("revoked", False))
+    return states
+
 @app.route("/verify", methods=["POST"])
 def verify():
     diploma = request.json
 
-    # Check if diploma exists in database
-    db_diploma = diplomas_collection.find_one({"id": diploma.get("id")})
-    
-    if not db_diploma:
+    # Check if diploma exists (in-memory index first, database otherwise)
+    diploma_id = diploma.get("id")
+    if not isinstance(diploma_id, str):
+        return jsonify({"valid": False, "reason": "unknown diploma"})
+    states = diploma_states([diploma_id])
+
+    if diploma_id not in states:
         return jsonify({"valid": False, "reason": "unknown diploma"})
 
-    if db_diploma.get("revoked", False):
+    if states[diploma["id"]]:
         return jsonify({"valid": False, "reason": "revoked diploma"})
 
     # Verify the signature
-    signature = base64.b64decode(diploma["signature"])
-    unsigned = diploma.copy()
-    del unsigned["signature"]
-    payload = json.dumps(unsigned, sort_keys=True).encode()
+    reason = check_signature(diploma)
+    if reason:
+        return jsonify({"valid": False, "reason": reason})
+    return jsonify({"valid": True})
 
-    try:
-        PUBLIC_KEY.verify(signature, payload)
-        return jsonify({"valid": True})
-    except Exception:
-        return jsonify({"valid": False, "reason": "invalid signature"})
+
+# -----------------------------
+# VERIFY BATCH
+# -----------------------------
+VERIFY_BATCH_MAX = int(os.getenv('VERIFY_BATCH_MAX', 500))
+# Signature checks run on threads (cryptography releases the GIL) for large batches
+VERIFY_BATCH_THREADS = int(os.getenv('VERIFY_BATCH_THREADS', 0))
+VERIFY_BATCH_THREAD_MIN = 64
+verify_executor = cpu_executor(VERIFY_BATCH_THREADS) if VERIFY_BATCH_THREADS > 0 else None
+
+@app.route("/verify_batch", methods=["POST"])
+def verify_batch():
+    """Verify up to VERIFY_BATCH_MAX diplomas with at most one database query.
+
+    Body: a list of diplomas or ``{"diplomas": [...]}``. Results are returned
+    in input order with the same shape as ``/verify``.
+    """
+    data = request.json
+    diplomas = data.get("diplomas") if isinstance(data, dict) else data
+
+    if not isinstance(diplomas, list) or not diplomas:
+        return jsonify({"error": "Expected a non-empty list of diplomas"}), 400
+    if len(diplomas) > VERIFY_BATCH_MAX:
+        return jsonify({"error": f"At most {VERIFY_BATCH_MAX} diplomas per request"}), 400
+
+    # At most one round-trip for the existence and revocation state of every diploma
+    revoked = diploma_states({
+        d.get("id") for d in diplomas if isinstance(d, dict) and isinstance(d.get("id"), str)
+    })
+
+    def check(diploma):
+        if not isinstance(diploma, dict) or not isinstance(diploma.get("id"), str):
+            return {"id": None, "valid": False, "reason": "malformed diploma"}
+        result = {"id": diploma.get("id"), "valid": False}
+        if diploma.get("id") not in revoked:
+            result["reason"] = "unknown diploma"
+        elif revoked[diploma["id"]]:
+            result["reason"] = "revoked diploma"
+        else:
+            reason = check_signature(diploma)
+            if reason:
+                result["reason"] = reason
+            else:
+                result["valid"] = True
+        return result
+
+    if verify_executor and len(diplomas) >= VERIFY_BATCH_THREAD_MIN:
+        results = list(verify_executor.map(check, diplomas))
+    elif len(diplomas) >= VERIFY_BATCH_THREAD_MIN:
+        # Keep large batches off the event loop under the gevent worker
+        results = cpu_offload.run(lambda: [check(diploma) for diploma in diplomas])
+    else:
+        results = [check(diploma) for diploma in diplomas]
+
+    return jsonify({
+        "total": len(results),
+        "valid": sum(1 for r in results if r["valid"]),
+        "results": results
+    })
 
 
 # -----------------------------
@@ -669,36 +1201,87 @@ def revoke():
     data = request.json
     diploma_id = data.get("id")
 
-    # Mark diploma as revoked in MongoDB
+    # Mark diploma as revoked in MongoDB; other workers pick it up from the change stream
     diplomas_collection.update_one(
         {"id": diploma_id},
-        {"$set": {"revoked": True}}
+        {"$set": {"revoked": True, "revoked_at": datetime.utcnow().isoformat() + "Z"}}
     )
+    if revocation_index:
+        revocation_index.revoke(diploma_id)
 
     return jsonify({"status": "ok"})
 
 # -----------------------------
 # LIST
 # -----------------------------
+LIST_DEFAULT_LIMIT = int(os.getenv('LIST_DEFAULT_LIMIT', 100))
+LIST_MAX_LIMIT = int(os.getenv('LIST_MAX_LIMIT', 1000))
+LIST_STREAM_BATCH_SIZE = int(os.getenv('LIST_STREAM_BATCH_SIZE', 500))
+
 @app.route("/list", methods=["GET"])
 @auth_required()
 def list_diplomas():
+    """List diplomas page by page (keyset on ``id``) or as an NDJSON stream.
+
+    Query parameters: ``after=<diploma id>`` (exclusive) and ``limit``. Pages
+    are returned as ``{"items": [...], "next_after": <id or null>}``. With
+    ``Accept: application/x-ndjson`` (or ``format=ndjson``) documents are
+    streamed one per line straight from the cursor; ``limit`` is then optional.
+    """
     user = request.user
 
     if user["role"] == "school":
         # School sees all diplomas
-        diplomas = list(diplomas_collection.find({}, {"_id": 0}))
+        query = {}
     elif user["role"] == "student":
         # Student sees only their diplomas
-        diplomas = list(diplomas_collection.find({"student_name": user["username"]}, {"_id": 0}))
+        query = {"student_name": user["username"]}
     else:
+        query = None
+
+    after = request.args.get("after")
+    if after and query is not None:
+        query["id"] = {"$gt": after}
+
+    stream = (request.args.get("format") == "ndjson"
+              or request.accept_mimetypes.best == "application/x-ndjson")
+
+    if stream:
+        limit = request.args.get("limit", type=int) or 0
+        if query is None:
+            return Response("", mimetype="application/x-ndjson")
+        cursor = (diplomas_collection.find(query, {"_id": 0})
+                  .sort("id", 1)
+                  .limit(max(limit, 0))
+                  .batch_size(LIST_STREAM_BATCH_SIZE))
+        return Response((json.dumps(diploma) + "\n" for diploma in cursor), mimetype="application/x-ndjson")
+
+    limit = min(max(request.args.get("limit", LIST_DEFAULT_LIMIT, type=int), 1), LIST_MAX_LIMIT)
+    if query is None:
         diplomas = []
+    else:
+        # Fetch one extra document to know whether another page exists
+        diplomas = list(diplomas_collection.find(query, {"_id": 0}).sort("id", 1).limit(limit + 1))
 
-    return jsonify(diplomas)
+    has_more = len(diplomas) > limit
+    diplomas = diplomas[:limit]
+    return jsonify({
+        "items": diplomas,
+        "next_after": diplomas[-1]["id"] if has_more else None
+    })
 
 # -----------------------------
 # DOWNLOAD
 # -----------------------------
+ZIP_STREAM_CHUNK_SIZE = int(os.getenv('ZIP_STREAM_CHUNK_KB', 64)) * 1024
+
+def diploma_zip_entries(diploma, pdf_path):
+    """Zip entries of a single diploma: its JSON (deflated) and its PDF (stored, not recompressed)."""
+    return [
+        (f"{diploma['id']}.json", json.dumps(diploma, indent=2).encode(), True),
+        (f"diplome_{diploma['student_name']}.pdf", file_chunks(pdf_path, ZIP_STREAM_CHUNK_SIZE), False)
+    ]
+
 @app.route("/download/<diploma_id>", methods=["GET"])
 @auth_required()
 def download_diploma(diploma_id):
@@ -720,33 +1303,121 @@ def download_diploma(diploma_id):
         if user["username"] != diploma["student_name"]:
             return jsonify({"error": "Forbidden"}), 403
     
-    # Create a zip file containing JSON and PDF
-    memory_file = io.BytesIO()
-    
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # Add JSON file
-        json_data = json.dumps(diploma, indent=2)
-        zf.writestr(f"{diploma_id}.json", json_data)
-        
-        # Add PDF file
-        pdf_path = os.path.join(PDFS_DIR, f"{diploma_id}.pdf")
-        if not os.path.exists(pdf_path):
-            # Generate PDF if it doesn't exist
-            try:
-                pdf_path = generate_diploma_pdf(diploma)
-            except Exception as e:
-                return jsonify({"error": f"Failed to generate PDF: {str(e)}"}), 500
-        
-        with open(pdf_path, 'rb') as pdf_file:
-            zf.writestr(f"diplome_{diploma['student_name']}.pdf", pdf_file.read())
-    
-    memory_file.seek(0)
+    # Render the PDF (if no store has it) before the response starts
+    try:
+        pdf_path = generate_diploma_pdf(diploma)
+    except Exception as e:
+        return jsonify({"error": f"Failed to generate PDF: {str(e)}"}), 500
     
-    return send_file(
-        memory_file,
+    return Response(
+        stream_zip(diploma_zip_entries(diploma, pdf_path), ZIP_STREAM_CHUNK_SIZE),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name=f"diplome_{diploma['student_name']}_{diploma_id}.zip"
+        headers=attachment_headers(f"diplome_{diploma['student_name']}_{diploma_id}.zip")
+    )
+
+
+# -----------------------------
+# DOWNLOAD BATCH
+# -----------------------------
+DOWNLOAD_BATCH_MAX_IDS = int(os.getenv('DOWNLOAD_BATCH_MAX_IDS', 5000))
+DOWNLOAD_BATCH_CURSOR_SIZE = 200
+
+def batch_download_entries(cursor, manifest):
+    """Zip entries for every diploma of the cursor, rendering missing PDFs in parallel."""
+    batch = []
+    for diploma in cursor:
+        batch.append(diploma)
+        if len(batch) >= DOWNLOAD_BATCH_CURSOR_SIZE:
+            yield from batch_download_chunk(batch, manifest)
+            batch = []
+    if batch:
+        yield from batch_download_chunk(batch, manifest)
+
+    yield "manifest.json", json.dumps(manifest, indent=2).encode(), True
+
+def batch_download_chunk(diplomas, manifest):
+    paths = {}
+    missing = []
+    for diploma in diplomas:
+        path = pdf_store.lookup(diploma)
+        if path:
+            paths[diploma["id"]] = path
+        else:
+            missing.append(diploma)
+
+    for diploma, pdf_data, error in render_pool.render_many(missing):
+        if error:
+            logger.error("failed to generate PDF", extra={"fields": {"diploma_id": diploma["id"], "error": str(error)}})
+            manifest["errors"].append({"id": diploma["id"], "error": str(error)})
+        else:
+            paths[diploma["id"]] = pdf_store.put(diploma, pdf_data)
+
+    for diploma in diplomas:
+        manifest["diplomas"].append(diploma["id"])
+        yield f"{diploma['id']}.json", json.dumps(diploma, indent=2).encode(), True
+        if diploma["id"] in paths:
+            yield (
+                f"diplome_{diploma['student_name']}_{diploma['id']}.pdf",
+                file_chunks(paths[diploma["id"]], ZIP_STREAM_CHUNK_SIZE),
+                False
+            )
+
+@app.route("/download_batch", methods=["POST"])
+@auth_required()
+def download_batch():
+    """Stream one ZIP with the JSON and PDF of every requested diploma.
+
+    Body: ``{"ids": [...]}`` or ``{"filter": {"degree_name": ..., "issued_from":
+    "YYYY-MM-DD", "issued_to": "YYYY-MM-DD"}}``.
+    """
+    data = request.json or {}
+    user = request.user
+    if not isinstance(data, dict):
+        return jsonify({"error": "Provide either ids or filter"}), 400
+
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"error": "ids must be a non-empty list"}), 400
+        if len(ids) > DOWNLOAD_BATCH_MAX_IDS:
+            return jsonify({"error": f"At most {DOWNLOAD_BATCH_MAX_IDS} ids per request"}), 400
+        query = {"id": {"$in": [str(i) for i in ids]}}
+    elif "filter" in data:
+        filters = data["filter"] or {}
+        if not isinstance(filters, dict):
+            return jsonify({"error": "filter must be an object"}), 400
+        # Strings only: a nested object would be read by MongoDB as an operator
+        for name in ("degree_name", "issued_from", "issued_to"):
+            if filters.get(name) is not None and not isinstance(filters[name], str):
+                return jsonify({"error": f"filter.{name} must be a string"}), 400
+        query = {}
+        if filters.get("degree_name"):
+            query["degree_name"] = filters["degree_name"]
+        issued_at = {}
+        if filters.get("issued_from"):
+            issued_at["$gte"] = filters["issued_from"]
+        if filters.get("issued_to"):
+            # A bare date includes the whole day
+            issued_to = filters["issued_to"]
+            issued_at["$lte"] = issued_to + "T23:59:59.999999Z" if len(issued_to) == 10 else issued_to
+        if issued_at:
+            query["issued_at"] = issued_at
+    else:
+        return jsonify({"error": "Provide either ids or filter"}), 400
+
+    # Students can only export their own diplomas
+    if user["role"] == "student":
+        query["student_name"] = user["username"]
+    elif user["role"] != "school":
+        return jsonify({"error": "Forbidden"}), 403
+
+    cursor = diplomas_collection.find(query, {"_id": 0}).sort("issued_at", 1).batch_size(DOWNLOAD_BATCH_CURSOR_SIZE)
+    manifest = {"generated_at": datetime.utcnow().isoformat() + "Z", "diplomas": [], "errors": []}
+
+    return Response(
+        stream_zip(batch_download_entries(cursor, manifest), ZIP_STREAM_CHUNK_SIZE),
+        mimetype='application/zip',
+        headers=attachment_headers(f"diplomes_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip")
     )
 
 
@@ -771,28 +1442,95 @@ def download_pdf(diploma_id):
         if user["username"] != diploma["student_name"]:
             return jsonify({"error": "Forbidden"}), 403
 
-    pdf_path = os.path.join(PDFS_DIR, f"{diploma_id}.pdf")
-    
-    if not os.path.exists(pdf_path):
-        # Generate PDF if it doesn't exist
-        try:
-            pdf_path = generate_diploma_pdf(diploma)
-        except Exception as e:
-            return jsonify({"error": f"Failed to generate PDF: {str(e)}"}), 500
+    # Rendered only if no store has it yet
+    try:
+        pdf_path = generate_diploma_pdf(diploma)
+    except Exception as e:
+        return jsonify({"error": f"Failed to generate PDF: {str(e)}"}), 500
     
     return send_file(pdf_path, as_attachment=True, download_name=f"diplome_{diploma['student_name']}_{diploma_id}.pdf")
 
+@app.route("/dl/<token>", methods=["GET"])
+def download_link(token):
+    """Serve the PDF behind a signed email link; no database lookup while the PDF is cached
+    and the revocation index vouches for the diploma."""
+    try:
+        claims = jwt.decode(token, SECRET, algorithms=["HS256"], audience=DOWNLOAD_LINK_AUDIENCE)
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Link has expired"}), 410
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid link"}), 404
+
+    diploma_id, key = claims["sub"], claims["key"]
+    # Only a diploma the index knows as valid skips the database check
+    status = revocation_index.status(diploma_id) if revocation_index else None
+    if status == "revoked" or (
+            status != "valid" and diplomas_collection.find_one({"id": diploma_id, "revoked": True}, {"_id": 1})):
+        return jsonify({"error": "Diploma has been revoked"}), 410
+
+    # The PDF behind a key never changes: browsers and proxies may keep it until the link expires
+    max_age = max(int(claims["exp"] - datetime.utcnow().timestamp()), 0)
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        pdf_path = pdf_store.lookup_key(key)
+        if pdf_path is None:
+            # Evicted from every store: render it again from the stored diploma
+            diploma = diplomas_collection.find_one({"id": diploma_id}, {"_id": 0})
+            if not diploma or pdf_key(diploma) != key:
+                return jsonify({"error": "not found"}), 404
+            try:
+                pdf_path = generate_diploma_pdf(diploma)
+            except Exception as e:
+                return jsonify({"error": f"Failed to generate PDF: {str(e)}"}), 500
+        response = send_file(pdf_path, mimetype="application/pdf", as_attachment=True,
+                             download_name=f"diplome_{diploma_id}.pdf", etag=key)
+    response.set_etag(key)
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
+
 
 # -----------------------------
 # LOGIN
 # -----------------------------
+def upgrade_password_hash(user, password):
+    """Re-hash a password made with outdated parameters; the login succeeds either way."""
+    try:
+        new_hash = password_verifier.hash(password)
+    except LoginOverloaded:
+        return  # next login will try again
+    # Skip if the password changed meanwhile
+    users_collection.update_one(
+        {"_id": user["_id"], "password": user["password"]},
+        {"$set": {"password": new_hash}}
+    )
+    password_verifier.rehashed += 1
+    logger.info("password hash upgraded", extra={"fields": {
+        "username": user["username"], "method": PASSWORD_HASH_METHOD
+    }})
+
 @app.route("/login", methods=["POST"])
 def login():
     data = request.json
 
     user = users_collection.find_one({"username": data.get("username")})
 
-    if user and check_password_hash(user["password"], data.get("password")):
+    # Accounts awaiting activation have no password yet
+    try:
+        valid = bool(user and user.get("password")) and password_verifier.verify(user["password"], data.get("password"))
+    except LoginOverloaded:
+        response = jsonify({"error": "Too many login attempts in progress, retry shortly"})
+        response.headers["Retry-After"] = str(LOGIN_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    if valid:
+        if password_verifier.needs_rehash(user["password"]):
+            upgrade_password_hash(user, data.get("password"))
+
         # Token expires in 24 hours
         token = jwt.encode(
             {
@@ -807,6 +1545,39 @@ def login():
 
     return jsonify({"error": "Invalid credentials"}), 401
 
+@app.route("/activate", methods=["POST"])
+def activate():
+    """Set the first password of an account created in deferred activation mode"""
+    data = request.json or {}
+    token = data.get("token")
+    password = data.get("password") or ""
+    if not token:
+        return jsonify({"error": "Missing token"}), 400
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return jsonify({"error": f"Password must be at least {MIN_PASSWORD_LENGTH} characters"}), 400
+
+    user = users_collection.find_one({"activation.token_hash": activation_token_hash(token)})
+    if not user:
+        return jsonify({"error": "Invalid activation link"}), 404
+    if user["activation"]["expires_at"] < datetime.utcnow():
+        return jsonify({"error": "Activation link has expired"}), 410
+
+    try:
+        password_hash = password_verifier.hash(password)
+    except LoginOverloaded:
+        response = jsonify({"error": "Too many requests in progress, retry shortly"})
+        response.headers["Retry-After"] = str(LOGIN_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    # The token is single-use: only the update that still finds it wins
+    result = users_collection.update_one(
+        {"_id": user["_id"], "activation.token_hash": user["activation"]["token_hash"]},
+        {"$set": {"password": password_hash}, "$unset": {"activation": ""}}
+    )
+    if result.modified_count == 0:
+        return jsonify({"error": "Invalid activation link"}), 404
+    return jsonify({"status": "ok", "username": user["username"]})
+
 # -----------------------------
 # DEBUG ROUTES (can remove in production)
 # -----------------------------
@@ -816,10 +1587,48 @@ def health_check():
     return jsonify({
         "status": "ok",
         "timestamp": datetime.utcnow().isoformat(),
-        "dist_exists": os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dist')),
+        "dist_exists": static_manifest.available,
+        "static_assets": static_manifest.stats(),
+        "pdf_store": pdf_store.stats(),
+        "revocation_index": revocation_index.stats() if revocation_index else None,
+        "outbox": outbox.stats(),
+        "login": password_verifier.stats(),
+        "auth_cache": token_cache.stats(),
+        "serving": cpu_offload.stats(),
         "message": "Backend is running"
     })
 
+# Queue depths: per-process values are summed over the workers,
+# global ones (read from MongoDB) are reported as-is by the scraped worker
+metrics.gauge("render_pool_inflight", "Diplomas queued or rendering on the render pool", lambda: render_pool.inflight)
+metrics.gauge("bulk_jobs_active", "Bulk jobs queued or running", lambda: job_queue.active)
+metrics.gauge("login_checks_pending", "Password checks waiting or running", lambda: password_verifier.pending)
+metrics.gauge(
+    "outbox_messages", "Outbox messages by status",
+    lambda: {(("status", status),): count for status, count in outbox.counts().items() if count is not None},
+    scope="global"
+)
+
+# Optional bearer token required from the scraper
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics, aggregated across gunicorn workers"""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/query_plans", methods=["GET"])
+@auth_required("school")
+def query_plans():
+    """Explain the hot queries and flag collection scans"""
+    report = audit_queries(db)
+    return jsonify({
+        "collection_scans": [entry["query"] for entry in report if entry["collection_scan"]],
+        "queries": report
+    })
+
 @app.route("/debug/routes", methods=["GET"])
 def debug_routes():
     """List all registered routes for debugging"""
@@ -835,66 +1644,44 @@ def debug_routes():
 # -----------------------------
 # SERVE REACT FRONTEND
 # -----------------------------
+# dist/ is scanned once: restart the app after rebuilding the frontend
+DIST_DIR = os.path.join(script_dir, 'dist')
+static_manifest = StaticManifest(DIST_DIR)
+
 @app.route('/', defaults={'path': ''}, methods=['GET', 'HEAD'])
 @app.route('/<path:path>', methods=['GET', 'HEAD'])
 def serve_react(path):
     """Serve React frontend in production - handles all GET requests for SPA routing"""
-    dist_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dist')
-    index_path = os.path.join(dist_path, 'index.html')
-    
-    # Enhanced debug logging with forced flush
-    print("\n" + "-"*80, flush=True)
-    print(f"📍 ROUTE REQUEST: {request.method} /{path}", flush=True)
-    print(f"   Full URL: {request.url}", flush=True)
-    print(f"   Referrer: {request.referrer}", flush=True)
-    print(f"   Accept: {request.headers.get('Accept', 'N/A')[:100]}", flush=True)
-    print(f"📂 Dist path: {dist_path}", flush=True)
-    print(f"   Dist exists: {os.path.exists(dist_path)}", flush=True)
-    print(f"📄 Index path: {index_path}", flush=True)
-    print(f"   Index exists: {os.path.exists(index_path)}", flush=True)
-    sys.stdout.flush()
+    if LOG_REQUEST_DEBUG:
+        logger.debug("spa route", extra={"fields": {
+            "path": path,
+            "referrer": request.referrer,
+            "accept": request.headers.get('Accept', 'N/A')[:100],
+            "accept_encoding": request.headers.get('Accept-Encoding')
+        }})
     
     # Serve React app if dist folder exists (production)
-    if os.path.exists(dist_path):
+    if static_manifest.available:
         # Check if it's a static file request (js, css, images, etc.)
         if path and '.' in path.split('/')[-1]:
-            file_path = os.path.join(dist_path, path)
-            print(f"🔍 Checking static file: {file_path}", flush=True)
-            if os.path.exists(file_path):
-                print(f"✅ Serving static file: {path}", flush=True)
-                print("-"*80 + "\n", flush=True)
-                sys.stdout.flush()
-                return send_from_directory(dist_path, path)
-            else:
-                print(f"❌ Static file NOT FOUND: {file_path}", flush=True)
-                print(f"   Available files in dist: {os.listdir(dist_path)[:10]}", flush=True)
-                print("-"*80 + "\n", flush=True)
-                sys.stdout.flush()
-                # Return error with debugging info
-                error_data = {
+            response = static_manifest.serve(path, request)
+            if response is None:
+                return jsonify({
                     'error': 'Static file not found',
-                    'path': path,
-                    'file_path': file_path,
-                    'dist_contents': os.listdir(dist_path)[:20]
-                }
-                print(f"⚠️ RETURNING 404 for static file")
-                return jsonify(error_data), 404
+                    'path': path
+                }), 404
+            return response
         
         # For all other routes (including /verify, /issue, etc.), serve index.html for React Router
-        if os.path.exists(index_path):
-            print(f"✅ Serving index.html for SPA route: /{path}", flush=True)
-            print("-"*80 + "\n", flush=True)
-            sys.stdout.flush()
-            return send_from_directory(dist_path, 'index.html')
+        if static_manifest.index is not None:
+            return static_manifest.serve_index(request)
         else:
-            print(f"❌ CRITICAL: index.html not found at {index_path}", flush=True)
-            print("-"*80 + "\n", flush=True)
-            sys.stdout.flush()
+            logger.error("index.html not found", extra={"fields": {"dist_path": DIST_DIR}})
             return jsonify({
                 'error': 'index.html not found',
-                'index_path': index_path,
-                'dist_exists': os.path.exists(dist_path),
-                'dist_contents': os.listdir(dist_path) if os.path.exists(dist_path) else []
+                'index_path': os.path.join(DIST_DIR, 'index.html'),
+                'dist_exists': True,
+                'dist_contents': os.listdir(DIST_DIR)
             }), 404
     else:
         # Development mode - show message
@@ -903,7 +1690,7 @@ def serve_react(path):
             <body style="font-family: Arial; padding: 50px; text-align: center;">
                 <h1>Low-Tech Diploma Platform</h1>
                 <p>Backend API is running on port {os.getenv('PORT', 5000)}</p>
-                <p style="color: red;">⚠️ dist/ folder not found at: {dist_path}</p>
+                <p style="color: red;">⚠️ dist/ folder not found at: {DIST_DIR}</p>
                 <p>To run the frontend in development mode:</p>
                 <pre style="background: #f4f4f4; padding: 20px; border-radius: 5px; display: inline-block; text-align: left;">
 npm install
@@ -921,10 +1708,11 @@ if __name__ == "__main__":
     # Disable debug in production
     debug_mode = os.getenv('FLASK_ENV') == 'development'
     
-    print(f"🚀 Starting Flask app on port {port}")
+    create_app()
+    logger.info("starting Flask app", extra={"fields": {"port": port}})
     if os.path.exists('dist'):
-        print("✅ Serving React frontend from dist/")
+        logger.info("serving React frontend from dist/")
     else:
-        print("⚠️  No dist/ folder found - running in API-only mode")
+        logger.warning("no dist/ folder found, running in API-only mode")
     
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
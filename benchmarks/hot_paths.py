@@ -0,0 +1,233 @@
+"""
+Microbenchmarks of the issuance and verification hot paths, each measured on its own.
+
+Every case runs the same code as the route it is named after:
+    pdf_render          render_diploma_pdf(), what generate_diploma_pdf() does on a cache miss
+    pdf_fetch_cached    generate_diploma_pdf() when the PDF is already stored
+    sign                canonical JSON + Ed25519 signature, as in /issue
+    verify_signature    check_signature(), the signature part of /verify
+    verify_route        POST /verify through the Flask test client
+    auth_decode         auth_required with the token cache disabled (AUTH_CACHE_SIZE=0)
+    auth_cached         auth_required with the token already in the cache
+    zip_build           the JSON + PDF archive streamed by /download/<id> (diploma_zip_entries)
+    csv_parse           BulkUpload: spool a CSV upload of --csv-rows rows and stream its rows
+
+Usage (results as JSON on stdout, optionally written to a file and compared
+with an earlier run):
+    JWT_SECRET=bench MONGO_URI=mongodb://localhost:27017 python benchmarks/hot_paths.py --output bench.json
+    python benchmarks/hot_paths.py --mongo mock --compare bench.json
+
+``--mongo mock`` runs without a server, on an in-process mongomock
+database (``pip install mongomock``). Diplomas created against a real server
+are deleted at the end; PDFs are written to a temporary PDFS_DIR, removed too.
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_app(mongo):
+    """Import app.py, on an in-process MongoDB stand-in if asked."""
+    os.environ.setdefault("JWT_SECRET", "bench")
+    # Keep rendered PDFs out of the repository's pdfs/
+    os.environ["PDFS_DIR"] = tempfile.mkdtemp(prefix="bench-pdfs-")
+    if mongo == "mock":
+        import mongomock
+        import pymongo
+
+        shared = mongomock.MongoClient()
+        # app.py passes server options mongomock does not know about
+        pymongo.MongoClient = lambda *args, **kwargs: shared
+        os.environ.setdefault("MONGO_URI", "mongodb://mongomock")
+    # Keep stdout for the results: startup messages and request logs go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as server
+        server.create_app()
+    return server
+
+
+def measure(fn, iterations, repeat):
+    """Run ``fn`` ``iterations`` times per round; returns per-call timings in microseconds."""
+    fn()  # warm-up
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        rounds.append((time.perf_counter() - start) / iterations * 1e6)
+    return {
+        "iterations": iterations,
+        "repeat": repeat,
+        "best_us": round(min(rounds), 1),
+        "median_us": round(statistics.median(rounds), 1),
+        "ops_per_second": round(1e6 / min(rounds), 1)
+    }
+
+
+def make_diploma(server):
+    diploma = {
+        "id": str(uuid.uuid4()),
+        "student_name": "bench-student",
+        "degree_name": "Master Benchmark",
+        "issued_at": datetime.utcnow().isoformat() + "Z",
+        "revoked": False
+    }
+    payload = json.dumps(diploma, sort_keys=True).encode()
+    diploma["signature"] = base64.b64encode(server.PRIVATE_KEY.sign(payload)).decode()
+    return diploma
+
+
+def make_csv(rows):
+    lines = ["student_name,student_email,degree_name"]
+    lines += [f"Student {i},student{i}@example.org,Master Benchmark" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def cases(server, args):
+    """Name -> (callable, iterations) for every benchmarked path."""
+    from werkzeug.datastructures import FileStorage
+    from zip_stream import stream_zip
+    from diploma_pdf import render_diploma_pdf
+    from token_cache import TokenCache
+
+    diploma = make_diploma(server)
+    server.diplomas_collection.insert_one(dict(diploma))
+    if server.revocation_index:
+        server.revocation_index.add(diploma["id"])
+    pdf_path = server.generate_diploma_pdf(diploma)
+
+    unsigned = {key: value for key, value in diploma.items() if key != "signature"}
+    token = server.jwt.encode({"username": "school", "role": "school"}, server.SECRET, algorithm="HS256")
+    client = server.app.test_client()
+    protected = server.auth_required("school")(lambda: None)
+    no_token_cache = TokenCache(max_entries=0)
+    csv_data = make_csv(args.csv_rows)
+
+    def sign():
+        server.PRIVATE_KEY.sign(json.dumps(unsigned, sort_keys=True).encode())
+
+    def verify_signature():
+        assert server.check_signature(diploma) is None
+
+    def verify_route():
+        assert client.post("/verify", json=diploma).get_json()["valid"]
+
+    def call_protected():
+        with server.app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            assert protected() is None
+
+    def auth_decode():
+        # auth_required looks the cache up at call time: swap in an empty one
+        token_cache, server.token_cache = server.token_cache, no_token_cache
+        try:
+            call_protected()
+        finally:
+            server.token_cache = token_cache
+
+    def zip_build():
+        entries = server.diploma_zip_entries(diploma, pdf_path)
+        for _ in stream_zip(entries, server.ZIP_STREAM_CHUNK_SIZE):
+            pass
+
+    def csv_parse():
+        upload = server.BulkUpload.save(FileStorage(io.BytesIO(csv_data), filename="bench.csv"))
+        try:
+            assert sum(1 for _ in upload) == args.csv_rows
+        finally:
+            upload.close()
+
+    n = args.iterations
+    selected = {
+        "pdf_render": (lambda: render_diploma_pdf(diploma), max(1, n // 50)),
+        "pdf_fetch_cached": (lambda: server.generate_diploma_pdf(diploma), n),
+        "sign": (sign, n),
+        "verify_signature": (verify_signature, n),
+        "verify_route": (verify_route, max(1, n // 10)),
+        "auth_decode": (auth_decode, max(1, n // 10)),
+        "auth_cached": (call_protected, max(1, n // 10)),
+        "zip_build": (zip_build, max(1, n // 10)),
+        "csv_parse": (csv_parse, max(1, n // 500))
+    }
+    return diploma, selected
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print best-time ratios against an earlier run (> 1.0 means slower now)."""
+    with open(baseline_path) as fp:
+        baseline = json.load(fp)
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):", file=sys.stderr)
+    for name, current in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if before:
+            ratio = current["best_us"] / before["best_us"]
+            print(f"  {name:<18} {before['best_us']:>10.1f} -> {current['best_us']:>10.1f} us  x{ratio:.2f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", choices=["server", "mock"], default="server",
+                        help="MONGO_URI server, or an in-process mongomock database")
+    parser.add_argument("--iterations", type=int, default=1000, help="calls per round for the cheapest cases")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per case (best and median are kept)")
+    parser.add_argument("--csv-rows", type=int, default=1000, help="rows of the parsed CSV")
+    parser.add_argument("--only", nargs="+", metavar="CASE", help="run only these cases")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare with")
+    args = parser.parse_args()
+
+    server = load_app(args.mongo)
+    diploma, selected = cases(server, args)
+    try:
+        results = {
+            "revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "mongo": args.mongo,
+            "cases": {}
+        }
+        for name, (fn, iterations) in selected.items():
+            if args.only and name not in args.only:
+                continue
+            results["cases"][name] = measure(fn, iterations, args.repeat)
+    finally:
+        server.diplomas_collection.delete_one({"id": diploma["id"]})
+        shutil.rmtree(server.PDFS_DIR, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""
+End-to-end load test of a gunicorn configuration.
+
+Boots ``gunicorn 'app:create_app()'`` against a throwaway ``mongod`` (started in a
+temporary directory and deleted afterwards) and a fake SMTP server run by
+this script, so nothing leaves the machine. The database is seeded through
+the API itself: the school issues a diploma per test student and the
+students log in with the password found in the email they receive.
+
+Virtual users then replay a weighted mix of scenarios for ``--duration``
+seconds:
+    student     POST /login -> GET /list -> GET /download_pdf/<id>
+    verify      a burst of POST /verify of known diplomas (public)
+    issue       POST /issue of a new diploma and student account
+while one ``/bulk_issue`` upload of ``--bulk-rows`` rows runs in the
+background. Latency percentiles and throughput are reported per route, as
+JSON on stdout.
+
+Usage:
+    python benchmarks/load_test.py --workers 2 --threads 4 --concurrency 16 --duration 60
+    python benchmarks/load_test.py --mix student=2,verify=6,issue=1 --output load.json
+    python benchmarks/load_test.py --mongo-uri mongodb://127.0.0.1:27018   # already running throwaway server
+
+The load generator runs on the same machine; compare configurations with
+the same ``--concurrency`` and keep it below what the box can drive.
+"""
+import argparse
+import email
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCHOOL = ("school", "schoolpass")
+DEFAULT_MIX = "student=2,verify=5,issue=1"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# -----------------------------
+# FAKE SMTP SERVER
+# -----------------------------
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Accepts every message (AUTH included) and keeps them in memory."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port):
+        super().__init__(("127.0.0.1", port), _SmtpHandler)
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+    def received(self):
+        with self.lock:
+            return list(self.messages)
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 load-test sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250-sink")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command == b"AUTH":
+                self.reply("235 accepted")
+            elif command == b"DATA":
+                self.reply("354 end with .")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                with self.server.lock:
+                    self.server.messages.append(b"".join(data))
+                self.reply("250 queued")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+def credentials_from_mail(raw):
+    """(username, password) announced in a new-account email, if any."""
+    message = email.message_from_bytes(raw)
+    for part in message.walk():
+        if part.get_content_type() == "text/plain":
+            text = part.get_payload(decode=True).decode(part.get_content_charset() or "utf-8", "replace")
+            username = re.search(r"Nom d'utilisateur: (.+)", text)
+            password = re.search(r"Mot de passe: (\S+)", text)
+            if username and password:
+                return username.group(1).strip(), password.group(1)
+    return None
+
+
+# -----------------------------
+# SERVERS
+# -----------------------------
+def start_mongod(binary, workdir):
+    port = free_port()
+    dbpath = os.path.join(workdir, "db")
+    os.makedirs(dbpath)
+    process = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=open(os.path.join(workdir, "mongod.log"), "w"), stderr=subprocess.STDOUT
+    )
+    wait_for_port(port, process, "mongod")
+    return process, f"mongodb://127.0.0.1:{port}"
+
+
+def start_gunicorn(args, mongo_uri, smtp_port, workdir):
+    port = free_port()
+    env = dict(
+        os.environ,
+        JWT_SECRET="load-test",
+        MONGO_URI=mongo_uri,
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=str(smtp_port),
+        MAIL_USE_TLS="False",
+        MAIL_USERNAME="load-test@example.org",
+        MAIL_PASSWORD="load-test",
+        # Deliver seeding emails quickly instead of at the production rate
+        MAIL_RATE_PER_MINUTE="100000",
+        OUTBOX_POLL_SECONDS="0.2",
+        METRICS_DIR=os.path.join(workdir, "metrics"),
+        # gunicorn.conf.py only preloads the app for non-gevent workers
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        # app.py derives LOGIN_MAX_PENDING from it, not from --threads
+        GUNICORN_THREADS=str(args.threads),
+        LOG_SAMPLE_RATE=str(args.log_sample_rate)
+    )
+    command = [
+        sys.executable, "-m", "gunicorn", "app:create_app()",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--threads", str(args.threads),
+        "--worker-class", args.worker_class,
+        "--timeout", "120"
+    ] + args.gunicorn_arg
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=env,
+        stdout=open(os.path.join(workdir, "gunicorn.log"), "w"), stderr=subprocess.STDOUT
+    )
+    wait_for_port(port, process, "gunicorn", timeout=60)
+    # The port opens before the workers have imported the app
+    deadline = time.time() + 60
+    while True:
+        try:
+            status, _ = HttpClient(port).request("GET", "/api/health", "health")
+            if status == 200:
+                return process, port
+        except OSError:
+            pass
+        if time.time() > deadline or process.poll() is not None:
+            raise RuntimeError(f"gunicorn did not become healthy, see {workdir}/gunicorn.log")
+        time.sleep(0.2)
+
+
+def wait_for_port(port, process, name, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{name} did not listen on port {port} within {timeout}s")
+
+
+def stop(process):
+    if process and process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# -----------------------------
+# HTTP CLIENT AND RESULTS
+# -----------------------------
+class Recorder:
+    """Latencies and errors per route label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.enabled = False
+
+    def record(self, route, seconds, ok):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+
+class HttpClient:
+    """Keep-alive connection of one virtual user."""
+
+    def __init__(self, port, recorder=None):
+        self.port = port
+        self.recorder = recorder
+        self.token = None
+        self.connection = None
+
+    def request(self, method, path, route, body=None, headers=None, expect=(200,)):
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection = None
+            status, data = 0, b""
+        if self.recorder:
+            self.recorder.record(route, time.perf_counter() - started, status in expect)
+        return status, data
+
+    def json(self, *args, **kwargs):
+        status, data = self.request(*args, **kwargs)
+        try:
+            return status, json.loads(data)
+        except ValueError:
+            return status, None
+
+    def login(self, username, password, recorder_route="POST /login"):
+        status, body = self.json("POST", "/login", recorder_route, {"username": username, "password": password})
+        self.token = body.get("token") if status == 200 else None
+        return self.token is not None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": recorder.errors[route],
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2)
+        }
+    return routes
+
+
+# -----------------------------
+# SEEDING
+# -----------------------------
+def seed(port, sink, students, timeout=120):
+    """Issue one diploma per test student and collect their emailed passwords."""
+    school = HttpClient(port)
+    if not school.login(*SCHOOL):
+        raise RuntimeError("school login failed")
+    run_id = uuid.uuid4().hex[:8]
+    names = [f"load-{run_id}-{i}" for i in range(students)]
+    for i, name in enumerate(names):
+        status, body = school.json("POST", "/issue", "seed", {
+            "student_name": name,
+            "student_email": f"{name}@example.org",
+            "degree_name": "Master Load Test"
+        })
+        if status != 200 or not body.get("account_created"):
+            raise RuntimeError(f"seeding /issue failed: {status} {body}")
+
+    wanted = set(names)
+    deadline = time.time() + timeout
+    while True:
+        accounts = {}
+        for raw in sink.received():
+            found = credentials_from_mail(raw)
+            if found and found[0] in wanted:
+                accounts[found[0]] = found[1]
+        if len(accounts) == len(wanted):
+            break
+        if time.time() > deadline:
+            raise RuntimeError(f"only {len(accounts)}/{len(wanted)} account emails received")
+        time.sleep(0.2)
+
+    status, body = school.json("GET", "/list?limit=1000", "seed")
+    diplomas = [d for d in body["items"] if d["student_name"] in wanted]
+    return school.token, sorted(accounts.items()), diplomas
+
+
+def bulk_csv(rows):
+    run_id = uuid.uuid4().hex[:8]
+    lines = ["student_name,student_email,degree_name"]
+    lines += [f"bulk-{run_id}-{i},bulk-{run_id}-{i}@example.org,Master Load Test" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def multipart(field, filename, data, content_type="text/csv"):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+# -----------------------------
+# SCENARIOS
+# -----------------------------
+def scenario_student(client, context, rng):
+    username, password = rng.choice(context["accounts"])
+    if not client.login(username, password):
+        return
+    status, body = client.json("GET", "/list", "GET /list")
+    if status == 200 and body["items"]:
+        diploma_id = rng.choice(body["items"])["id"]
+        client.request("GET", f"/download_pdf/{diploma_id}", "GET /download_pdf/<id>")
+    client.token = None
+
+
+def scenario_verify(client, context, rng):
+    for _ in range(context["verify_burst"]):
+        client.request("POST", "/verify", "POST /verify", rng.choice(context["diplomas"]))
+
+
+def scenario_issue(client, context, rng):
+    client.token = context["school_token"]
+    name = f"load-issue-{uuid.uuid4().hex[:12]}"
+    client.request("POST", "/issue", "POST /issue", {
+        "student_name": name,
+        "student_email": f"{name}@example.org",
+        "degree_name": "Master Load Test"
+    })
+    client.token = None
+
+
+SCENARIOS = {"student": scenario_student, "verify": scenario_verify, "issue": scenario_issue}
+
+
+def run_bulk(port, context, recorder, rows, result):
+    """Upload one large CSV and follow its job until it finishes."""
+    client = HttpClient(port, recorder)
+    client.token = context["school_token"]
+    body, headers = multipart("file", "load.csv", bulk_csv(rows))
+    started = time.perf_counter()
+    status, queued = client.json("POST", "/bulk_issue", "POST /bulk_issue", body, headers, expect=(202,))
+    if status != 202:
+        result.update({"error": f"upload failed with status {status}"})
+        return
+    while True:
+        status, job = client.json("GET", f"/jobs/{queued['job_id']}", "GET /jobs/<id>")
+        if status == 200 and job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.5)
+    result.update({
+        "rows": rows,
+        "status": job["status"],
+        "success": job.get("success"),
+        "seconds": round(time.perf_counter() - started, 2),
+        "rows_per_second": round(rows / (time.perf_counter() - started), 2)
+    })
+
+
+def virtual_user(index, port, context, recorder, mix, stop_at, seed_value):
+    rng = random.Random(seed_value + index)
+    client = HttpClient(port, recorder)
+    names, weights = zip(*mix.items())
+    while time.time() < stop_at:
+        SCENARIOS[rng.choices(names, weights)[0]](client, context, rng)
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r} (known: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn --workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn --threads")
+    parser.add_argument("--worker-class", default="gthread", help="gunicorn --worker-class (gthread or gevent)")
+    parser.add_argument("--gunicorn-arg", action="append", default=[], help="extra gunicorn argument (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--students", type=int, default=20, help="seeded student accounts")
+    parser.add_argument("--verify-burst", type=int, default=10, help="/verify calls per verify scenario")
+    parser.add_argument("--bulk-rows", type=int, default=500, help="rows of the background bulk upload (0 to skip)")
+    parser.add_argument("--log-sample-rate", type=float, default=0.0, help="LOG_SAMPLE_RATE of the server")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary")
+    parser.add_argument("--mongo-uri", help="use this throwaway server instead of starting mongod")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the virtual users")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory (logs, database)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lowtechdiploma-load-")
+    mongod = gunicorn = None
+    sink = SmtpSink(free_port()).start()
+    try:
+        if args.mongo_uri:
+            mongo_uri = args.mongo_uri
+        else:
+            if not shutil.which(args.mongod):
+                sys.exit(f"{args.mongod} not found: install MongoDB or pass --mongo-uri")
+            mongod, mongo_uri = start_mongod(args.mongod, workdir)
+        gunicorn, port = start_gunicorn(args, mongo_uri, sink.server_address[1], workdir)
+        print(f"gunicorn on port {port}, seeding {args.students} students...", file=sys.stderr)
+
+        school_token, accounts, diplomas = seed(port, sink, args.students)
+        context = {
+            "school_token": school_token,
+            "accounts": accounts,
+            "diplomas": diplomas,
+            "verify_burst": args.verify_burst
+        }
+
+        recorder = Recorder()
+        stop_at = time.time() + args.warmup + args.duration
+        users = [
+            threading.Thread(target=virtual_user, args=(i, port, context, recorder, args.mix, stop_at, args.seed), daemon=True)
+            for i in range(args.concurrency)
+        ]
+        for user in users:
+            user.start()
+        time.sleep(args.warmup)
+        print(f"measuring for {args.duration}s with {args.concurrency} virtual users...", file=sys.stderr)
+        recorder.enabled = True
+        started = time.perf_counter()
+
+        bulk = {}
+        bulk_thread = None
+        if args.bulk_rows:
+            bulk_thread = threading.Thread(target=run_bulk, args=(port, context, recorder, args.bulk_rows, bulk), daemon=True)
+            bulk_thread.start()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - started
+        recorder.enabled = False
+        if bulk_thread:
+            # Not part of the per-route figures once the measured window is over
+            bulk_thread.join()
+
+        total = sum(len(values) for values in recorder.latencies.values())
+        results = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "cpu_count": os.cpu_count(),
+            "gunicorn": {"workers": args.workers, "threads": args.threads, "worker_class": args.worker_class,
+                         "extra": args.gunicorn_arg},
+            "concurrency": args.concurrency,
+            "duration_seconds": round(elapsed, 2),
+            "mix": args.mix,
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "routes": summarize(recorder, elapsed),
+            "bulk_issue": bulk or None,
+            "emails_received": len(sink.received())
+        }
+    finally:
+        sink.shutdown()
+        stop(gunicorn)
+        stop(mongod)
+        if args.keep:
+            print(f"kept {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Benchmark: cold start of the application.
+
+In a fresh interpreter per run, measures the time to ``import app``, to a
+ready app (``create_app()`` when the revision has it) and to the first
+``/api/health`` response. Revisions given with ``--revision`` are measured
+from a ``git archive`` export, so the current tree can be compared with an
+older commit:
+    python benchmarks/startup.py --mongo mock --revision HEAD~1
+
+``--gunicorn`` additionally boots ``gunicorn 'app:create_app()'`` from the
+current tree with and without ``--preload`` and reports the time to the
+first healthy response and the memory (PSS, Linux) of master and workers.
+It needs a MongoDB server: ``--mongo-uri`` or a throwaway ``mongod``.
+
+Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from load_test import HttpClient, free_port, start_mongod, stop, wait_for_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter from the tree being measured
+CHILD = """
+import json, os, sys, time
+started = time.perf_counter()
+if os.environ.get("BENCH_MONGOMOCK"):
+    import mongomock, pymongo
+    shared = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: shared
+import app
+imported = time.perf_counter()
+if hasattr(app, "create_app"):
+    app.create_app()
+ready = time.perf_counter()
+status = app.app.test_client().get("/api/health").status_code
+answered = time.perf_counter()
+print("RESULT " + json.dumps({"import": imported - started, "ready": ready - started,
+                  "first_request": answered - started, "status": status}))
+"""
+
+
+def export(revision, workdir):
+    """Extract ``revision`` of the repository into a temporary directory."""
+    target = os.path.join(workdir, revision.replace("/", "_").replace("~", "-"))
+    os.makedirs(target)
+    archive = subprocess.run(["git", "archive", revision], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+    return target
+
+
+def measure_import(tree, env, repeat):
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=tree, env=env,
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"startup failed in {tree}:\n{result.stderr[-2000:]}")
+        # The app's own log lines share stdout
+        line = next(line for line in result.stdout.splitlines() if line.startswith("RESULT "))
+        runs.append(json.loads(line[len("RESULT "):]))
+    summary = {"runs": repeat, "status": runs[-1]["status"]}
+    for phase in ("import", "ready", "first_request"):
+        summary[f"{phase}_ms"] = round(statistics.median(run[phase] for run in runs) * 1000, 1)
+    return summary
+
+
+def process_tree_pss_mb(pid):
+    """Proportional set size of a process and its children, in MB (Linux only)."""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fp:
+            pids += [int(child) for child in fp.read().split()]
+        total_kb = 0
+        for member in pids:
+            with open(f"/proc/{member}/smaps_rollup") as fp:
+                for line in fp:
+                    if line.startswith("Pss:"):
+                        total_kb += int(line.split()[1])
+    except OSError:
+        return None
+    return round(total_kb / 1024, 1)
+
+
+def measure_gunicorn(mongo_uri, workers, preload, workdir, settle):
+    port = free_port()
+    config = os.path.join(workdir, f"gunicorn-{'preload' if preload else 'per-worker'}.conf.py")
+    with open(config, "w") as fp:
+        fp.write(f"preload_app = {preload}\n")
+    env = dict(os.environ, JWT_SECRET="startup-bench", MONGO_URI=mongo_uri)
+    log = open(os.path.join(workdir, "gunicorn.log"), "a")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:create_app()", "--config", config,
+         "--bind", f"127.0.0.1:{port}", "--workers", str(workers)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        wait_for_port(port, process, "gunicorn", timeout=120)
+        client = HttpClient(port)
+        while client.request("GET", "/api/health", "health")[0] != 200:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited, see {workdir}/gunicorn.log")
+            time.sleep(0.02)
+        healthy = time.perf_counter() - started
+        # Let every worker finish booting before reading memory
+        time.sleep(settle)
+        return {"workers": workers, "first_healthy_ms": round(healthy * 1000, 1),
+                "pss_mb": process_tree_pss_mb(process.pid)}
+    finally:
+        stop(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", choices=["server", "mock"], default="mock",
+                        help="MONGO_URI server, or an in-process mongomock database per run")
+    parser.add_argument("--mongo-uri", help="MongoDB server (default: a throwaway mongod when one is needed)")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary")
+    parser.add_argument("--revision", action="append", default=[], help="git revision to compare with (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per tree (median is kept)")
+    parser.add_argument("--gunicorn", action="store_true", help="also boot gunicorn with and without --preload")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds before reading gunicorn memory")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lowtechdiploma-startup-")
+    mongod = None
+    try:
+        mongo_uri = args.mongo_uri
+        if not mongo_uri and (args.mongo == "server" or args.gunicorn):
+            if not shutil.which(args.mongod):
+                sys.exit(f"{args.mongod} not found: install MongoDB, pass --mongo-uri or use --mongo mock")
+            mongod, mongo_uri = start_mongod(args.mongod, workdir)
+
+        env = dict(os.environ, JWT_SECRET="startup-bench", MONGO_URI=mongo_uri or "mongodb://127.0.0.1:1")
+        if args.mongo == "mock":
+            env["BENCH_MONGOMOCK"] = "1"
+
+        results = {"python": sys.version.split()[0], "cpu_count": os.cpu_count(), "mongo": args.mongo, "trees": {}}
+        trees = [("working tree", ROOT)] + [(revision, export(revision, workdir)) for revision in args.revision]
+        for name, tree in trees:
+            results["trees"][name] = measure_import(tree, env, args.repeat)
+
+        if args.gunicorn:
+            results["gunicorn"] = {
+                mode: measure_gunicorn(mongo_uri, args.workers, preload, workdir, args.settle)
+                for mode, preload in (("per_worker", False), ("preload", True))
+            }
+    finally:
+        stop(mongod)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
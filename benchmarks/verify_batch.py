@@ -0,0 +1,79 @@
+"""
+Benchmark: per-diploma cost of /verify versus /verify_batch.
+
+Usage (against a throwaway database, diplomas are created then deleted):
+    JWT_SECRET=bench MONGO_URI=mongodb://localhost:27017 python benchmarks/verify_batch.py --count 500
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as server
+
+
+def make_diplomas(count):
+    """Sign and insert ``count`` diplomas exactly like /issue does."""
+    diplomas = []
+    for i in range(count):
+        diploma = {
+            "id": str(uuid.uuid4()),
+            "student_name": f"bench-student-{i}",
+            "degree_name": "Benchmark",
+            "issued_at": datetime.utcnow().isoformat() + "Z",
+            "revoked": False
+        }
+        payload = json.dumps(diploma, sort_keys=True).encode()
+        diploma["signature"] = base64.b64encode(server.PRIVATE_KEY.sign(payload)).decode()
+        diplomas.append(diploma)
+    server.diplomas_collection.insert_many([dict(d) for d in diplomas])
+    return diplomas
+
+
+def time_single(client, diplomas):
+    start = time.perf_counter()
+    for diploma in diplomas:
+        response = client.post("/verify", json=diploma)
+        assert response.get_json()["valid"], response.get_json()
+    return time.perf_counter() - start
+
+
+def time_batch(client, diplomas):
+    start = time.perf_counter()
+    for i in range(0, len(diplomas), server.VERIFY_BATCH_MAX):
+        response = client.post("/verify_batch", json=diplomas[i:i + server.VERIFY_BATCH_MAX])
+        assert response.get_json()["valid"] == len(diplomas[i:i + server.VERIFY_BATCH_MAX])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=500, help="number of diplomas")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per endpoint (best is kept)")
+    args = parser.parse_args()
+
+    client = server.create_app().test_client()
+    diplomas = make_diplomas(args.count)
+    try:
+        single = min(time_single(client, diplomas) for _ in range(args.repeat))
+        batch = min(time_batch(client, diplomas) for _ in range(args.repeat))
+    finally:
+        server.diplomas_collection.delete_many({"id": {"$in": [d["id"] for d in diplomas]}})
+
+    results = {
+        "count": args.count,
+        "single_us_per_diploma": round(single / args.count * 1e6, 1),
+        "batch_us_per_diploma": round(batch / args.count * 1e6, 1),
+        "speedup": round(single / batch, 1)
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
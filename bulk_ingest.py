@@ -0,0 +1,206 @@
+"""
+Streaming reader for bulk issuance uploads (CSV and Excel .xlsx).
+
+The upload is copied to a temporary file, since the background job reads it
+after the request has returned, and only its header is checked before the
+job is queued. Rows are then read one at a time, CSV with the ``csv`` module
+and XLSX with openpyxl's read-only mode, and handed out in fixed-size chunks,
+so memory stays flat whatever the size of the file.
+
+CSV files are decoded as UTF-8, or as Windows-1252 (what French Excel writes
+with "CSV (séparateur: point-virgule)") when they are not valid UTF-8. The
+whole file is checked while it is spooled, so a job never stops halfway
+through on an undecodable row.
+
+Rows are identified by :func:`row_fingerprint` so that re-uploading a file
+only issues the rows that are new or changed.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unicodedata
+from itertools import islice
+
+REQUIRED_COLUMNS = ("student_name", "student_email", "degree_name")
+# Optional column selecting a diploma template per row
+OPTIONAL_COLUMNS = ("template",)
+EXTENSIONS = (".csv", ".xlsx")
+
+# Copy buffer used while spooling the upload to disk
+SPOOL_CHUNK_SIZE = 1024 * 1024
+# Encodings tried for CSV files, in order
+CSV_ENCODINGS = ("utf-8-sig", "cp1252")
+
+
+class BulkFileError(ValueError):
+    """The upload cannot be read as a bulk issuance file."""
+
+
+class MissingColumnsError(BulkFileError):
+    def __init__(self, missing):
+        super().__init__(f"Missing required columns: {', '.join(missing)}")
+        self.missing = missing
+
+
+def chunked(iterable, size):
+    """Yield lists of at most ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _spool_text(source, target):
+    """Copy a CSV upload to ``target`` and return the first encoding that decodes all of it."""
+    decoders = {encoding: codecs.getincrementaldecoder(encoding)() for encoding in CSV_ENCODINGS}
+    while True:
+        chunk = source.read(SPOOL_CHUNK_SIZE)
+        final = not chunk
+        for encoding, decoder in list(decoders.items()):
+            try:
+                decoder.decode(chunk, final=final)
+            except UnicodeDecodeError:
+                del decoders[encoding]
+        if final:
+            break
+        target.write(chunk)
+    for encoding in CSV_ENCODINGS:
+        if encoding in decoders:
+            return encoding
+    raise BulkFileError("The CSV file must be encoded in UTF-8 or Windows-1252")
+
+
+def _cell(value):
+    return "" if value is None else str(value).strip()
+
+
+def _normalise(value):
+    # Case, Unicode composition and runs of whitespace do not make a row new
+    return " ".join(unicodedata.normalize("NFC", value).split()).casefold()
+
+
+def row_fingerprint(row):
+    """SHA-256 of a row's normalised (student name, email, degree)."""
+    parts = (row["student_name"], row["student_email"], row["degree_name"])
+    return hashlib.sha256("\x1f".join(_normalise(part) for part in parts).encode()).hexdigest()
+
+
+class BulkUpload:
+    """A spooled bulk upload whose rows are read lazily from disk."""
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.encoding = CSV_ENCODINGS[0]
+        self.columns = None
+        self._count = None
+
+    @classmethod
+    def save(cls, file, directory=None):
+        """Spool an uploaded ``FileStorage`` to disk and validate its header.
+
+        Raises ``MissingColumnsError`` or ``BulkFileError``; the temporary
+        file is removed in that case.
+        """
+        kind = os.path.splitext(file.filename or "")[1].lower()
+        if kind not in EXTENSIONS:
+            raise BulkFileError("Only CSV and Excel (.xlsx) files are supported")
+
+        fd, path = tempfile.mkstemp(prefix="bulk-", suffix=kind, dir=directory)
+        upload = cls(path, kind)
+        try:
+            with os.fdopen(fd, "wb") as target:
+                if kind == ".csv":
+                    upload.encoding = _spool_text(file.stream, target)
+                else:
+                    shutil.copyfileobj(file.stream, target, SPOOL_CHUNK_SIZE)
+            upload.columns = upload._header()
+            missing = [column for column in REQUIRED_COLUMNS if column not in upload.columns]
+            if missing:
+                raise MissingColumnsError(missing)
+        except BulkFileError:
+            upload.close()
+            raise
+        except Exception as e:
+            upload.close()
+            raise BulkFileError(f"Failed to read file: {e}") from e
+        return upload
+
+    def _records(self):
+        """Raw records of the file, header first."""
+        if self.kind == ".csv":
+            return self._csv_records()
+        return self._xlsx_records()
+
+    def _csv_records(self):
+        with open(self.path, "rb") as raw:
+            # Excel exports often start with a BOM and use ';' in French locales
+            first_line = raw.readline()
+            raw.seek(0)
+            if first_line.startswith(codecs.BOM_UTF8):
+                first_line = first_line[len(codecs.BOM_UTF8):]
+            delimiter = ";" if first_line.count(b";") > first_line.count(b",") else ","
+            with io.TextIOWrapper(raw, encoding=self.encoding, newline="") as text:
+                yield from csv.reader(text, delimiter=delimiter)
+
+    def _xlsx_records(self):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    def _header(self):
+        records = self._records()
+        try:
+            header = next(records, None)
+        finally:
+            records.close()
+        if header is None:
+            raise BulkFileError("The file is empty")
+        return [_cell(column) for column in header]
+
+    def __iter__(self):
+        """Yield one dict per row with a student name, in file order."""
+        records = self._records()
+        try:
+            header = [_cell(column) for column in next(records, None) or []]
+            positions = {
+                column: header.index(column)
+                for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if column in header
+            }
+            for record in records:
+                values = {
+                    column: _cell(record[index]) if index < len(record) else ""
+                    for column, index in positions.items()
+                }
+                # Skip empty rows
+                if not values.get("student_name"):
+                    continue
+                row = {column: values.get(column, "") for column in REQUIRED_COLUMNS}
+                if values.get("template"):
+                    row["template"] = values["template"]
+                yield row
+        finally:
+            records.close()
+
+    def __len__(self):
+        # One streaming pass, done once by the job before it starts issuing
+        if self._count is None:
+            self._count = sum(1 for _ in self)
+        return self._count
+
+    def close(self):
+        """Delete the spooled file."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,137 @@
+"""
+Diploma PDF rendering.
+
+This module has no import-time side effects so that it can be loaded by the
+worker processes of :class:`RenderPool` without touching MongoDB or Flask.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+
+# -----------------------------
+# RENDER A SINGLE DIPLOMA
+# -----------------------------
+def render_diploma_pdf(diploma):
+    """Generate a professional PDF diploma and return its bytes."""
+    # ReportLab is imported with the templates, on the first render only
+    from diploma_templates import get_registry
+
+    # Only the variable fields are drawn; the static layer comes from the template
+    return get_registry().select(diploma).render(diploma)
+
+
+# -----------------------------
+# MULTI-CORE RENDER POOL
+# -----------------------------
+def _render_timed(diploma):
+    """Render in a pool worker and return ``(pdf_bytes, seconds)``."""
+    started = time.perf_counter()
+    pdf = render_diploma_pdf(diploma)
+    return pdf, time.perf_counter() - started
+
+
+def _init_render_worker(memory_limit_mb):
+    """Cap the address space of a render worker so one PDF cannot exhaust the host."""
+    if memory_limit_mb:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class RenderPool:
+    """Process pool that renders diplomas on every core, outside the GIL.
+
+    Memory is bounded by four settings: the number of worker processes,
+    ``max_tasks_per_child`` (workers are recycled so ReportLab caches cannot
+    grow forever), ``memory_limit_mb`` (hard address-space limit per worker)
+    and ``max_inflight`` (how many diplomas may be queued at once).
+    """
+
+    def __init__(self, max_workers=None, max_tasks_per_child=None,
+                 memory_limit_mb=None, max_inflight=64, on_render=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self.memory_limit_mb = memory_limit_mb
+        self.max_inflight = max(max_inflight, 1)
+        # Called with the render time measured inside the worker process
+        self.on_render = on_render
+        self.inflight = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Spawned lazily: workers start clean instead of inheriting the
+        # parent's threads and MongoDB sockets through fork()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_render_worker,
+                    initargs=(self.memory_limit_mb,),
+                    max_tasks_per_child=self.max_tasks_per_child
+                )
+            return self._executor
+
+    def _replace_broken(self, executor):
+        """Drop a pool broken by a dead worker (OOM kill, memory limit, failed initializer)."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, diploma):
+        """Schedule one diploma; the future resolves to ``(pdf_bytes, seconds)``."""
+        executor = self._get_executor()
+        try:
+            return executor.submit(_render_timed, diploma)
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            return self._get_executor().submit(_render_timed, diploma)
+
+    def render_many(self, items, key=lambda item: item):
+        """Render ``key(item)`` for every item and yield ``(item, pdf_bytes, error)``.
+
+        Results are streamed back in completion order while at most
+        ``max_inflight`` diplomas are queued in the pool, so callers can keep
+        working (sending emails, writing to MongoDB) as PDFs come back.
+        """
+        # future -> (item, key(item), whether it was already resubmitted)
+        pending = {}
+        for item in items:
+            if len(pending) >= self.max_inflight:
+                yield from self._collect(pending, FIRST_COMPLETED)
+            diploma = key(item)
+            pending[self.submit(diploma)] = (item, diploma, False)
+            self.inflight += 1
+        while pending:
+            yield from self._collect(pending, FIRST_COMPLETED)
+
+    def _collect(self, pending, return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            item, diploma, retried = pending.pop(future)
+            try:
+                pdf, seconds = future.result()
+            except Exception as e:
+                # Lost with a broken pool: resubmitted once to a fresh one
+                if isinstance(e, BrokenProcessPool) and not retried:
+                    pending[self.submit(diploma)] = (item, diploma, True)
+                    continue
+                self.inflight -= 1
+                yield item, None, e
+                continue
+            self.inflight -= 1
+            if self.on_render:
+                self.on_render(seconds)
+            yield item, pdf, None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,240 @@
+"""
+Diploma template engine.
+
+A template describes the static layer of a diploma (borders, title, subtitle,
+signature line, watermark) and where the variable fields go. The static layer
+is compiled once per template into a compressed PDF form XObject; rendering a
+diploma then only writes a small text overlay that draws that form and the
+student's name, degree, date and ID on top of it.
+
+Templates other than ``default`` are loaded from the JSON file named by
+``DIPLOMA_TEMPLATES_FILE``::
+
+    {
+      "templates": [
+        {"name": "master", "title": "MASTER", "primary_color": "#0d47a1"}
+      ],
+      "degrees": {"Master en Informatique": "master"}
+    }
+
+Each template overrides any attribute of :class:`DiplomaTemplate`; the
+``degrees`` map picks a template from the degree name when a diploma does
+not name one explicitly.
+"""
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+MONTHS_FR = ['', 'janvier', 'février', 'mars', 'avril', 'mai', 'juin',
+             'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
+
+# Standard PDF fonts used by the templates, mapped to their resource names
+FONTS = {
+    "Helvetica": "F1",
+    "Helvetica-Bold": "F2",
+    "Helvetica-Oblique": "F3",
+    "Helvetica-BoldOblique": "F4",
+}
+
+
+def _rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i + 2], 16) / 255 for i in (0, 2, 4))
+
+
+def _num(value):
+    return f"{value:.3f}".rstrip('0').rstrip('.')
+
+
+def _pdf_string(text):
+    """Encode text as a PDF literal string in WinAnsi (cp1252) encoding."""
+    raw = text.encode('cp1252', 'replace')
+    raw = raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'\\r')
+    return b'(' + raw + b')'
+
+
+def _text(font, size, color, x, y, text, centered=False):
+    """Content stream operators drawing one line of text."""
+    if centered:
+        x -= stringWidth(text, font, size) / 2
+    return (
+        f"BT /{FONTS[font]} {_num(size)} Tf {' '.join(_num(c) for c in _rgb(color))} rg "
+        f"1 0 0 1 {_num(x)} {_num(y)} Tm ".encode()
+        + _pdf_string(text) + b" Tj ET\n"
+    )
+
+
+class DiplomaTemplate:
+    """Layout and wording of a diploma; attributes can be overridden per template."""
+
+    name = "default"
+    title = "DIPLÔME"
+    subtitle = "Ce document certifie que"
+    achievement = "a obtenu avec succès le diplôme de"
+    date_label = "Délivré le"
+    signature_label = "Signature de l'etablissement"
+    watermark = "LOW-TECH DIPLOMA"
+    primary_color = "#1a472a"
+    accent_color = "#2e7d32"
+    text_color = "#000000"
+    muted_color = "#808080"
+    watermark_color = "#e6e6e6"
+    watermark_alpha = 0.3
+
+    def __init__(self, **overrides):
+        for key, value in overrides.items():
+            if not hasattr(DiplomaTemplate, key):
+                raise ValueError(f"Unknown template attribute: {key}")
+            setattr(self, key, value)
+        self.width, self.height = A4
+        self._static = None
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # STATIC LAYER (compiled once)
+    # -----------------------------
+    def static_stream(self):
+        """Content stream of everything that is identical on every diploma."""
+        width, height = self.width, self.height
+        stroke = ' '.join(_num(c) for c in _rgb(self.primary_color))
+        ops = [
+            # Outer and inner decorative borders
+            f"{stroke} RG 3 w {_num(2*cm)} {_num(2*cm)} {_num(width - 4*cm)} {_num(height - 4*cm)} re S\n".encode(),
+            f"1 w {_num(2.3*cm)} {_num(2.3*cm)} {_num(width - 4.6*cm)} {_num(height - 4.6*cm)} re S\n".encode(),
+            _text("Helvetica-Bold", 32, self.primary_color, width / 2, height - 5*cm, self.title, centered=True),
+            _text("Helvetica", 14, self.text_color, width / 2, height - 6.5*cm, self.subtitle, centered=True),
+            _text("Helvetica", 14, self.text_color, width / 2, height - 11*cm, self.achievement, centered=True),
+            # Signature section
+            _text("Helvetica-Oblique", 10, self.text_color, width - 10*cm, 5*cm, self.signature_label),
+            f"{_num(width - 10*cm)} {_num(4.7*cm)} m {_num(width - 3*cm)} {_num(4.7*cm)} l S\n".encode(),
+        ]
+        # Rotated, translucent watermark
+        if self.watermark:
+            ops.append(
+                f"q /GS1 gs 1 0 0 1 {_num(width / 2)} {_num(height / 2)} cm "
+                f"0.7071 0.7071 -0.7071 0.7071 0 0 cm\n".encode()
+                + _text("Helvetica-BoldOblique", 40, self.watermark_color, 0, 0, self.watermark, centered=True)
+                + b"Q\n"
+            )
+        return b"".join(ops)
+
+    def _compile(self):
+        """Build the PDF objects shared by every diploma using this template.
+
+        Objects 1-8 (catalog, pages, page, fonts, form XObject) never change,
+        so their bytes and xref offsets are cached; object 9 is the per-diploma
+        overlay stream.
+        """
+        width, height = _num(self.width), _num(self.height)
+        fonts = " ".join(f"/{ref} {4 + i} 0 R" for i, ref in enumerate(FONTS.values()))
+        form = zlib.compress(self.static_stream())
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+             f"/Resources << /Font << {fonts} >> /XObject << /Tpl 8 0 R >> >> /Contents 9 0 R >>").encode(),
+        ]
+        for font in FONTS:
+            objects.append(f"<< /Type /Font /Subtype /Type1 /BaseFont /{font} /Encoding /WinAnsiEncoding >>".encode())
+        objects.append(
+            (f"<< /Type /XObject /Subtype /Form /BBox [0 0 {width} {height}] "
+             f"/Resources << /Font << {fonts} >> /ExtGState << /GS1 << /ca {_num(self.watermark_alpha)} >> >> >> "
+             f"/Filter /FlateDecode /Length {len(form)} >>\nstream\n").encode()
+            + form + b"\nendstream"
+        )
+
+        prefix = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(prefix))
+            prefix += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        return bytes(prefix), offsets
+
+    def compiled(self):
+        with self._lock:
+            if self._static is None:
+                self._static = self._compile()
+            return self._static
+
+    # -----------------------------
+    # PER-DIPLOMA OVERLAY
+    # -----------------------------
+    def overlay_stream(self, diploma):
+        """Content stream drawing the static form and the variable fields."""
+        width, height = self.width, self.height
+        issue_date = datetime.fromisoformat(diploma['issued_at'].replace('Z', '+00:00'))
+        date_str = f"{issue_date.day} {MONTHS_FR[issue_date.month]} {issue_date.year}"
+        return b"".join([
+            b"q /Tpl Do Q\n",
+            _text("Helvetica-Bold", 24, self.accent_color, width / 2, height - 9*cm, diploma['student_name'], centered=True),
+            _text("Helvetica-Bold", 18, self.primary_color, width / 2, height - 13*cm, diploma['degree_name'], centered=True),
+            _text("Helvetica", 12, self.text_color, width / 2, height - 16*cm, f"{self.date_label} {date_str}", centered=True),
+            _text("Helvetica", 8, self.muted_color, width / 2, 3*cm, f"ID: {diploma['id']}", centered=True),
+        ])
+
+    def render(self, diploma):
+        """Return the PDF bytes of one diploma."""
+        prefix, offsets = self.compiled()
+        overlay = self.overlay_stream(diploma)
+
+        out = bytearray(prefix)
+        offsets = offsets + [len(out)]
+        out += f"{len(offsets)} 0 obj\n<< /Length {len(overlay)} >>\nstream\n".encode() + overlay + b"\nendstream\nendobj\n"
+
+        xref = len(out)
+        out += f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode()
+        out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+        out += f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+        return bytes(out)
+
+
+# -----------------------------
+# TEMPLATE REGISTRY
+# -----------------------------
+class TemplateRegistry:
+    """Named templates plus the degree -> template mapping."""
+
+    def __init__(self):
+        self.templates = {"default": DiplomaTemplate()}
+        self.degrees = {}
+
+    def register(self, template):
+        self.templates[template.name] = template
+
+    def load_file(self, path):
+        with open(path, encoding='utf-8') as fp:
+            config = json.load(fp)
+        for overrides in config.get("templates", []):
+            self.register(DiplomaTemplate(**overrides))
+        for degree, name in config.get("degrees", {}).items():
+            if name not in self.templates:
+                raise ValueError(f"Degree {degree!r} uses unknown template {name!r}")
+            self.degrees[degree] = name
+
+    def select(self, diploma):
+        """Explicit ``template`` field first, then the degree mapping, then ``default``."""
+        name = diploma.get("template") or self.degrees.get(diploma.get("degree_name"), "default")
+        return self.templates.get(name, self.templates["default"])
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Template registry of this process, loaded on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = TemplateRegistry()
+            path = os.getenv('DIPLOMA_TEMPLATES_FILE')
+            if path:
+                registry.load_file(path)
+            _registry = registry
+        return _registry
@@ -0,0 +1,62 @@
+"""
+Gunicorn settings, read automatically from the working directory.
+
+The command-line flags in start.sh and the Dockerfile still apply; this
+file only holds what depends on them.
+"""
+import glob
+import os
+import tempfile
+
+# Run create_app() once in the master (database checks, keys, templates) and
+# fork ready workers that share it copy-on-write. The gevent worker has to
+# patch the standard library before the app is imported, so it loads the app
+# in each worker instead.
+preload_app = os.getenv("GUNICORN_WORKER_CLASS", "gthread") != "gevent"
+
+# app.py sizes LOGIN_MAX_PENDING from GUNICORN_THREADS: take the thread count
+# from the same variable so both always agree
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+
+# Per-worker metrics snapshots (see metrics.py), in a directory of this master.
+# Same path as metrics.default_directory(), without importing the app here.
+def _metrics_dir():
+    return os.environ.setdefault(
+        "METRICS_DIR", os.path.join(tempfile.gettempdir(), f"lowtechdiploma-metrics-{os.getpid()}")
+    )
+
+
+def _remove(pattern):
+    for path in glob.glob(pattern):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def on_starting(server):
+    if server.cfg.threads != threads:
+        # --threads on the command line overrides this file. Without --preload the app is
+        # imported by the workers, after this hook, and reads the corrected value.
+        os.environ["GUNICORN_THREADS"] = str(server.cfg.threads)
+        if server.cfg.preload_app:
+            server.log.warning("--threads %s differs from GUNICORN_THREADS=%s, which sized LOGIN_MAX_PENDING; "
+                               "set GUNICORN_THREADS instead", server.cfg.threads, threads)
+    # Snapshots left by an earlier run would be summed forever
+    directory = _metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    _remove(os.path.join(directory, "*.json*"))
+
+
+def child_exit(server, worker):
+    _remove(os.path.join(os.environ["METRICS_DIR"], f"{worker.pid}.json*"))
+
+
+def on_exit(server):
+    directory = os.environ["METRICS_DIR"]
+    _remove(os.path.join(directory, "*.json*"))
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
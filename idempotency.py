@@ -0,0 +1,61 @@
+"""
+``Idempotency-Key`` support for POST endpoints.
+
+The first request carrying a key claims it in the ``idempotency_keys``
+collection (unique per owner and key) and its response is stored there once
+it is known. A retry with the same key, e.g. after a client-side timeout, gets
+the stored response back instead of running the request a second time. Keys
+expire after 24 hours through a TTL index (see schema.py).
+"""
+import hashlib
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+MAX_KEY_LENGTH = 255
+
+
+def request_hash(method, path, body):
+    """Fingerprint of a request, to refuse a key reused for a different one."""
+    return hashlib.sha256(f"{method} {path}\n".encode() + body).hexdigest()
+
+
+class IdempotencyStore:
+    """Claims keys and stores the responses to replay."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def claim(self, owner, key, fingerprint):
+        """Claim ``key`` for a new request.
+
+        Returns None when the request should run, otherwise the record of the
+        earlier request (``response`` is None while it is still running).
+        """
+        for _ in range(2):
+            try:
+                self.collection.insert_one({
+                    "owner": owner,
+                    "key": key,
+                    "request_hash": fingerprint,
+                    "status_code": None,
+                    "response": None,
+                    "created_at": datetime.utcnow()
+                })
+                return None
+            except DuplicateKeyError:
+                record = self.collection.find_one({"owner": owner, "key": key}, {"_id": 0})
+                # Expired or released in between: claim it again
+                if record:
+                    return record
+        return None
+
+    def complete(self, owner, key, status_code, response):
+        self.collection.update_one(
+            {"owner": owner, "key": key},
+            {"$set": {"status_code": status_code, "response": response}}
+        )
+
+    def release(self, owner, key):
+        """Forget a key whose request failed, so that it can be retried."""
+        self.collection.delete_one({"owner": owner, "key": key})
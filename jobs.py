@@ -0,0 +1,202 @@
+"""
+Background job queue for long-running school operations (bulk issuance).
+
+Job state lives in the MongoDB ``jobs`` collection so that any gunicorn worker
+can answer progress requests, while the rows themselves are processed by a
+small thread pool inside the worker that accepted the upload.
+
+That worker refreshes ``updated_at`` of its queued and running jobs every few
+seconds. A job whose ``updated_at`` is older than ``lease_seconds`` lost its
+worker (crash, restart, OOM kill) and is reported as failed by :meth:`get`.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Progress is written back to MongoDB in batches instead of once per row
+PROGRESS_FLUSH_ROWS = 50
+PROGRESS_FLUSH_SECONDS = 1.0
+# Error of a job whose worker stopped refreshing it
+INTERRUPTED_ERROR = "Job interrupted: its worker stopped"
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(timestamp.rstrip("Z"))
+
+
+class JobQueue:
+    """Persisted job registry backed by a lazily created thread pool."""
+
+    def __init__(self, collection, max_workers=2, context_factory=None, max_details=None, lease_seconds=300):
+        self.collection = collection
+        self.max_workers = max_workers
+        # Per-row details kept in the job document (counters stay exact), so
+        # very large jobs stay far below MongoDB's 16 MB document limit
+        self.max_details = max_details
+        # Called around each job, e.g. ``app.app_context`` for Flask-Mail
+        self.context_factory = context_factory
+        self.lease_seconds = lease_seconds
+        # Ids of the jobs of this process that are queued or running
+        self._active = set()
+        self._executor = None
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        """Jobs of this process that are queued or running."""
+        with self._lock:
+            return len(self._active)
+
+    def _get_executor(self):
+        # Created on first use so that no thread exists before gunicorn forks
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="job-worker"
+                )
+                self._heartbeat = threading.Thread(target=self._beat_forever, name="job-heartbeat", daemon=True)
+                self._heartbeat.start()
+            return self._executor
+
+    def _beat_forever(self):
+        while True:
+            time.sleep(self.lease_seconds / 4)
+            with self._lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                self.collection.update_many(
+                    {"id": {"$in": job_ids}, "status": {"$in": ["queued", "running"]}},
+                    {"$set": {"updated_at": _now()}}
+                )
+            except Exception as e:
+                logger.warning("job heartbeat failed", extra={"fields": {"error": str(e)}})
+
+    def submit(self, kind, rows, handler, owner=None):
+        """Persist a new job and schedule ``handler(rows, report)``.
+
+        ``rows`` may be any sized iterable; for a streamed upload ``len()``
+        is computed by the worker when the job starts, not by the request.
+        The handler processes the rows in whatever batches suit it and calls
+        ``report(details)`` with one result dict per finished row.
+        """
+        job_id = str(uuid.uuid4())
+        self.collection.insert_one({
+            "id": job_id,
+            "kind": kind,
+            "owner": owner,
+            "status": "queued",
+            "total": None,
+            "done": 0,
+            "success": 0,
+            "skipped": 0,
+            "failed": 0,
+            "details": [],
+            "error": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": _now()
+        })
+        with self._lock:
+            self._active.add(job_id)
+        self._get_executor().submit(self._run, job_id, rows, handler)
+        return job_id
+
+    def get(self, job_id):
+        """Return the job document with its current throughput, or None."""
+        job = self.collection.find_one({"id": job_id}, {"_id": 0})
+        if not job:
+            return None
+        if job["status"] in ("queued", "running") and self._expired(job):
+            job = self._interrupt(job)
+
+        job["rows_per_second"] = 0.0
+        job["elapsed_seconds"] = 0.0
+        if job.get("started_at"):
+            started = _parse(job["started_at"])
+            ended = _parse(job["finished_at"]) if job.get("finished_at") else datetime.utcnow()
+            elapsed = max((ended - started).total_seconds(), 0.0)
+            job["elapsed_seconds"] = round(elapsed, 3)
+            if elapsed > 0:
+                job["rows_per_second"] = round(job["done"] / elapsed, 2)
+        return job
+
+    def _expired(self, job):
+        return (datetime.utcnow() - _parse(job["updated_at"])).total_seconds() > self.lease_seconds
+
+    def _interrupt(self, job):
+        """Mark a job whose worker is gone as failed; returns the job as stored."""
+        finished = {"status": "failed", "error": INTERRUPTED_ERROR, "finished_at": _now(), "updated_at": _now()}
+        # Only if no heartbeat or progress arrived in between
+        result = self.collection.update_one(
+            {"id": job["id"], "status": job["status"], "updated_at": job["updated_at"]},
+            {"$set": finished}
+        )
+        if result.modified_count:
+            logger.warning("job interrupted", extra={"fields": {"job_id": job["id"], "done": job["done"]}})
+            return {**job, **finished}
+        return self.collection.find_one({"id": job["id"]}, {"_id": 0})
+
+    def _flush(self, job_id, pending, extra=None):
+        update = {"$set": {"updated_at": _now(), **(extra or {})}}
+        if pending:
+            update["$inc"] = {
+                "done": len(pending),
+                "success": sum(1 for d in pending if d.get("status") == "success"),
+                "skipped": sum(1 for d in pending if d.get("status") == "skipped"),
+                "failed": sum(1 for d in pending if d.get("status") not in ("success", "skipped"))
+            }
+            details = {"$each": pending}
+            if self.max_details is not None:
+                details["$slice"] = self.max_details
+            update["$push"] = {"details": details}
+        self.collection.update_one({"id": job_id}, update)
+
+    def _run(self, job_id, rows, handler):
+        self.collection.update_one(
+            {"id": job_id},
+            {"$set": {"status": "running", "started_at": _now(), "updated_at": _now()}}
+        )
+        pending = []
+        last_flush = [time.monotonic()]
+
+        def report(details):
+            """Record finished rows; progress is flushed in batches."""
+            pending.extend(details)
+            if (len(pending) >= PROGRESS_FLUSH_ROWS
+                    or time.monotonic() - last_flush[0] >= PROGRESS_FLUSH_SECONDS):
+                self._flush(job_id, list(pending))
+                pending.clear()
+                last_flush[0] = time.monotonic()
+
+        try:
+            total = len(rows)
+            self.collection.update_one({"id": job_id}, {"$set": {"total": total}})
+            with (self.context_factory() if self.context_factory else nullcontext()):
+                handler(rows, report)
+
+            self._flush(job_id, pending, {"status": "done", "finished_at": _now()})
+            logger.info("job finished", extra={"fields": {"job_id": job_id, "rows": total}})
+        except Exception as e:
+            logger.error("job failed", extra={"fields": {"job_id": job_id, "error": str(e)}})
+            self._flush(job_id, pending, {"status": "failed", "error": str(e), "finished_at": _now()})
+        finally:
+            # Streamed uploads delete their spooled file
+            if hasattr(rows, "close"):
+                rows.close()
+            with self._lock:
+                self._active.discard(job_id)
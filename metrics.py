@@ -0,0 +1,282 @@
+"""
+Prometheus metrics shared by every gunicorn worker.
+
+Each process keeps its counters and histograms in memory and writes a
+snapshot to ``METRICS_DIR/<pid>.json`` every few seconds. ``/metrics`` is
+answered by whichever worker receives the scrape: it merges its live values
+with the other workers' snapshots, so the totals cover the whole server
+(values from other workers are at most ``flush_interval`` seconds old).
+
+The directory belongs to one gunicorn master: gunicorn.conf.py points
+METRICS_DIR at a directory named after the master's pid, empties it when the
+master starts and removes a worker's snapshot when that worker exits, so a
+restart never sums old snapshots. Prometheus reads the resulting drop of a
+counter as a reset.
+
+Gauges are read when a snapshot is written (per-process values, summed) or
+only at scrape time (``scope="global"``, e.g. counts read from MongoDB).
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "lowtechdiploma_"
+
+
+def default_directory():
+    """Snapshot directory named after this process (the gunicorn master under --preload)."""
+    return os.path.join(tempfile.gettempdir(), f"lowtechdiploma-metrics-{os.getpid()}")
+
+
+def _labels_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """Counters, histograms and gauges of this process, aggregated across workers on scrape."""
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory or default_directory()
+        self.flush_interval = flush_interval
+        self._help = {}
+        self._counters = {}     # name -> {labels key: value}
+        self._histograms = {}   # name -> {labels key: [bucket counts..., sum, count]}
+        self._buckets = {}
+        self._gauges = {}       # name -> (fn, scope)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # -----------------------------
+    # DECLARATION
+    # -----------------------------
+    def counter(self, name, help_text):
+        self._help[name] = ("counter", help_text)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._help[name] = ("histogram", help_text)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = tuple(buckets)
+
+    def gauge(self, name, help_text, fn, scope="process"):
+        """``fn()`` returns a number or ``{labels tuple: number}``; process gauges are summed."""
+        self._help[name] = ("gauge", help_text)
+        self._gauges[name] = (fn, scope)
+
+    # -----------------------------
+    # RECORDING
+    # -----------------------------
+    def inc(self, name, labels=None, value=1):
+        self.ensure_started()
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        self.ensure_started()
+        key = _labels_key(labels)
+        buckets = self._buckets[name]
+        with self._lock:
+            series = self._histograms[name]
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    # -----------------------------
+    # SNAPSHOTS
+    # -----------------------------
+    def ensure_started(self):
+        # One flusher thread per process, started after gunicorn forked
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._thread = threading.Thread(target=self._flush_forever, name="metrics", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("metrics flush failed", extra={"fields": {"error": str(e)}})
+
+    def _read_gauges(self, scope):
+        values = {}
+        for name, (fn, gauge_scope) in self._gauges.items():
+            if gauge_scope != scope:
+                continue
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if not isinstance(value, dict):
+                value = {(): value}
+            values[name] = {key: float(v) for key, v in value.items() if v is not None}
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: list(v) for key, v in series.items()}
+                          for name, series in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms, "gauges": self._read_gauges("process")}
+
+    def flush(self):
+        """Write this process' snapshot for the other workers to read."""
+        snapshot = self.snapshot()
+        data = {kind: {name: [[list(map(list, key)), value] for key, value in series.items()]
+                       for name, series in snapshot[kind].items()}
+                for kind in snapshot}
+        data["pid"] = os.getpid()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(data, fp)
+        os.replace(tmp_path, path)
+
+    def _other_snapshots(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".json") or name == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fp:
+                    data = json.load(fp)
+            except (OSError, ValueError):
+                continue
+            snapshot = {kind: {metric: {tuple(map(tuple, key)): value for key, value in series}
+                               for metric, series in data.get(kind, {}).items()}
+                        for kind in ("counters", "histograms", "gauges")}
+            if not _alive(data.get("pid")):
+                # Not removed by gunicorn yet: keep what it counted, but not its gauges
+                snapshot["gauges"] = {}
+            yield snapshot
+
+    # -----------------------------
+    # EXPOSITION
+    # -----------------------------
+    def render(self):
+        """Prometheus text format, summed over every worker."""
+        self.ensure_started()
+        merged = self.snapshot()
+        for other in self._other_snapshots():
+            for kind in ("counters", "gauges"):
+                for name, series in other[kind].items():
+                    target = merged[kind].setdefault(name, {})
+                    for key, value in series.items():
+                        target[key] = target.get(key, 0) + value
+            for name, series in other["histograms"].items():
+                target = merged["histograms"].setdefault(name, {})
+                for key, values in series.items():
+                    current = target.get(key)
+                    target[key] = values if current is None else [a + b for a, b in zip(current, values)]
+        merged["gauges"].update(self._read_gauges("global"))
+
+        lines = []
+        for name, (kind, help_text) in sorted(self._help.items()):
+            full_name = PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == "histogram":
+                buckets = self._buckets[name]
+                for key, values in sorted(merged["histograms"].get(name, {}).items()):
+                    for bound, count in zip(buckets, values):
+                        lines.append(f"{full_name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key, [('le', '+Inf')])} {values[-1]}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {values[-2]}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {values[-1]}")
+            else:
+                series = merged["counters" if kind == "counter" else "gauges"].get(name, {})
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except (OSError, TypeError):
+        return False
+
+
+# -----------------------------
+# MONGODB COMMANDS
+# -----------------------------
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by operation and collection."""
+
+    def __init__(self, metrics, name="mongo_command_seconds"):
+        self.metrics = metrics
+        self.name = name
+        self._started = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._started[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, status):
+        collection = self._started.pop((event.connection_id, event.request_id), "")
+        self.metrics.observe(self.name, event.duration_micros / 1e6, {
+            "command": event.command_name,
+            "collection": collection,
+            "status": status
+        })
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+# Process-wide registry
+REGISTRY = Metrics(
+    directory=os.getenv('METRICS_DIR'),
+    flush_interval=float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+)
@@ -0,0 +1,299 @@
+"""
+Persistent email outbox.
+
+Issuance routes only write messages to the MongoDB ``outbox`` collection; a
+background thread in each worker claims pending messages in batches, sends a
+whole batch over one SMTP session (Flask-Mail's ``mail.connect()``), respects
+the provider's rate limit (shared by all workers) and retries failures with
+exponential backoff.
+Request latency therefore never depends on the mail server.
+
+Message bodies contain credentials, so the body and attachments are removed
+once a message is sent or has exhausted its attempts.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson.binary import Binary
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# A claimed message is released again if its worker dies before this delay.
+# The lease is renewed right before each send, so it only has to cover one
+# send, not a whole rate-limited batch.
+CLAIM_LEASE_SECONDS = 300
+MAX_BACKOFF_SECONDS = 3600
+
+
+class Outbox:
+    """Mongo-backed mail queue with a pooled SMTP delivery thread."""
+
+    def __init__(self, collection, mail_factory, context_factory, rate_per_minute=60,
+                 batch_size=20, max_attempts=5, backoff_seconds=30, poll_interval=2.0,
+                 on_send=None, rate_collection=None):
+        self.collection = collection
+        # Holds the next free send time of all workers; without it the
+        # rate limit only applies to this process
+        self.rate_collection = rate_collection
+        # Returns the Flask-Mail extension; called on first delivery so that
+        # importing the app does not import Flask-Mail
+        self.mail_factory = mail_factory
+        # Flask-Mail reads its settings from the app context
+        self.context_factory = context_factory
+        self.min_interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        # Called with (seconds, status) after every SMTP send attempt
+        self.on_send = on_send
+        self._next_send = 0.0
+        # Messages delivered but not yet marked sent (MongoDB failed meanwhile)
+        self._unmarked = {}
+        # Message counts by status, refreshed by the delivery thread so that
+        # health checks and metrics never wait on MongoDB
+        self._counts = {"pending": None, "sending": None, "failed": None}
+        self._counts_updated_at = None
+        self._counts_refreshed = 0.0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enqueue(self, subject, recipients, body, attachments=()):
+        """Persist a message for delivery and return its id.
+
+        ``attachments`` is a sequence of ``(filename, content_type, data)``.
+        """
+        message_id = str(uuid.uuid4())
+        self.collection.insert_one({
+            "id": message_id,
+            "status": "pending",
+            "subject": subject,
+            "recipients": list(recipients),
+            "body": body,
+            "attachments": [
+                {"filename": filename, "content_type": content_type, "data": Binary(data)}
+                for filename, content_type, data in attachments
+            ],
+            "attempts": 0,
+            "last_error": None,
+            "created_at": datetime.utcnow(),
+            "next_attempt_at": datetime.utcnow(),
+            "sent_at": None
+        })
+        self.ensure_started()
+        self._wake.set()
+        return message_id
+
+    # -----------------------------
+    # DELIVERY WORKER
+    # -----------------------------
+    def ensure_started(self):
+        # Started lazily so that the thread lives in the gunicorn worker, not the master
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                delivered = self.deliver_batch()
+            except Exception as e:
+                logger.error("outbox delivery failed", extra={"fields": {"error": str(e)}})
+                delivered = 0
+            if time.monotonic() - self._counts_refreshed >= self.poll_interval:
+                try:
+                    self.refresh_counts()
+                except Exception as e:
+                    logger.warning("outbox counts not refreshed", extra={"fields": {"error": str(e)}})
+            if not delivered:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self):
+        """Atomically claim up to ``batch_size`` due messages."""
+        claimed = []
+        now = datetime.utcnow()
+        # Identifies this claim, so that a lease taken over by another worker is not renewed
+        claim = str(uuid.uuid4())
+        for _ in range(self.batch_size):
+            doc = self.collection.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "locked_until": {"$lte": now}}
+                ]},
+                {"$set": {"status": "sending", "claim": claim,
+                          "locked_until": now + timedelta(seconds=CLAIM_LEASE_SECONDS)}},
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if doc is None:
+                break
+            claimed.append(doc)
+        return claimed
+
+    def _renew(self, doc):
+        """Extend the lease of a claimed message; False if another worker has reclaimed it."""
+        result = self.collection.update_one(
+            {"_id": doc["_id"], "status": "sending", "claim": doc["claim"]},
+            {"$set": {"locked_until": datetime.utcnow() + timedelta(seconds=CLAIM_LEASE_SECONDS)}}
+        )
+        # matched, not modified: a renewal within the same millisecond changes nothing
+        return result.matched_count == 1
+
+    def _throttle(self):
+        # Spread sends evenly to stay under the provider's quota
+        if self.rate_collection is not None and self.min_interval:
+            delay = self._reserve_send_slot() - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            return
+        delay = self._next_send - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_send = time.monotonic() + self.min_interval
+
+    def _reserve_send_slot(self):
+        """Reserve the next send time shared by every worker (compare-and-set on one document)."""
+        while True:
+            now = time.time()
+            doc = self.rate_collection.find_one({"_id": "smtp"})
+            if doc is None:
+                try:
+                    self.rate_collection.insert_one({"_id": "smtp", "next_send": now + self.min_interval})
+                    return now
+                except DuplicateKeyError:
+                    continue
+            slot = max(now, doc["next_send"])
+            result = self.rate_collection.update_one(
+                {"_id": "smtp", "next_send": doc["next_send"]},
+                {"$set": {"next_send": slot + self.min_interval}}
+            )
+            if result.modified_count:
+                return slot
+
+    def deliver_batch(self):
+        """Send one batch of due messages over a single SMTP connection."""
+        self._mark_unmarked()
+        # A delivered message whose lease expired before it could be marked is not sent twice
+        messages = [doc for doc in self._claim() if doc["_id"] not in self._unmarked]
+        if not messages:
+            return 0
+
+        sent = 0
+        # Claimed messages not sent, retried or given up yet
+        remaining = list(messages)
+        try:
+            with self.context_factory():
+                with self.mail_factory().connect() as connection:
+                    while remaining:
+                        doc = remaining[0]
+                        # Waiting for a send slot can outlast the lease at a low rate
+                        self._throttle()
+                        if not self._renew(doc):
+                            # Reclaimed by another worker, which sends it instead
+                            remaining.pop(0)
+                            continue
+                        started = time.perf_counter()
+                        try:
+                            connection.send(self._message(doc))
+                        except Exception as e:
+                            self._observe(started, "error")
+                            # The session may be unusable: retry this one, release the rest
+                            self._retry(doc, e)
+                            self._release(remaining[1:])
+                            remaining = []
+                            break
+                        remaining.pop(0)
+                        self._observe(started, "ok")
+                        sent += 1
+                        try:
+                            self._mark_sent(doc)
+                        except Exception as e:
+                            # Delivered: never retried, marked again before the next batch
+                            logger.error("could not mark email as sent", extra={"fields": {
+                                "message_id": doc.get("id"), "error": str(e)}})
+                            self._unmarked[doc["_id"]] = doc
+        except Exception as e:
+            # Could not open (or keep) the SMTP session
+            for doc in remaining:
+                self._retry(doc, e)
+        return sent
+
+    def _observe(self, started, status):
+        if self.on_send:
+            self.on_send(time.perf_counter() - started, status)
+
+    @staticmethod
+    def _message(doc):
+        from flask_mail import Message
+
+        msg = Message(subject=doc["subject"], recipients=doc["recipients"], body=doc["body"])
+        for attachment in doc.get("attachments", []):
+            msg.attach(attachment["filename"], attachment["content_type"], bytes(attachment["data"]))
+        return msg
+
+    def _mark_sent(self, doc):
+        self.collection.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": "sent", "sent_at": datetime.utcnow(), "attempts": doc["attempts"] + 1},
+             "$unset": {"body": "", "attachments": "", "locked_until": "", "claim": ""}}
+        )
+
+    def _mark_unmarked(self):
+        for doc in list(self._unmarked.values()):
+            self._mark_sent(doc)
+            del self._unmarked[doc["_id"]]
+
+    # Retries and releases only touch messages still held by this claim
+    def _retry(self, doc, error):
+        attempts = doc["attempts"] + 1
+        if attempts >= self.max_attempts:
+            logger.error("giving up on email", extra={"fields": {
+                "message_id": doc.get("id"), "attempts": attempts, "error": str(error)
+            }})
+            self.collection.update_one(
+                {"_id": doc["_id"], "claim": doc["claim"]},
+                {"$set": {"status": "failed", "attempts": attempts, "last_error": str(error)},
+                 "$unset": {"body": "", "attachments": "", "locked_until": "", "claim": ""}}
+            )
+            return
+        backoff = min(self.backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+        self.collection.update_one(
+            {"_id": doc["_id"], "claim": doc["claim"]},
+            {"$set": {"status": "pending", "attempts": attempts, "last_error": str(error),
+                      "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff)},
+             "$unset": {"locked_until": "", "claim": ""}}
+        )
+
+    def _release(self, docs):
+        if docs:
+            self.collection.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}, "claim": docs[0]["claim"]},
+                {"$set": {"status": "pending"}, "$unset": {"locked_until": "", "claim": ""}}
+            )
+
+    def refresh_counts(self):
+        # Counted from the (status, next_attempt_at) index
+        self._counts = {status: self.collection.count_documents({"status": status})
+                        for status in ("pending", "sending", "failed")}
+        self._counts_updated_at = datetime.utcnow().isoformat() + "Z"
+        self._counts_refreshed = time.monotonic()
+
+    def counts(self):
+        """Last message counts by status (None until the delivery thread has run)."""
+        return dict(self._counts)
+
+    def stats(self):
+        """Cached counts only: never queries MongoDB."""
+        stats = self.counts()
+        stats["counts_updated_at"] = self._counts_updated_at
+        stats["worker_running"] = self._thread is not None and self._thread.is_alive()
+        return stats
@@ -0,0 +1,183 @@
+"""
+Password hashing off the request path.
+
+Werkzeug's password hashes are deliberately slow. Issuance hashes new
+accounts' passwords on a pool of processes so that a large import uses every
+core and overlaps hashing with diploma signing instead of hashing row by row.
+Login checks run on a small bounded thread pool (the KDFs release the GIL)
+with an admission limit, so a burst of logins is turned away early instead
+of occupying every worker. Under the gevent worker those threads are native
+threads (see ``serving.py``), so a KDF never blocks the event loop.
+"""
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from serving import cpu_executor
+
+# Werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+DEFAULT_METHOD = "scrypt"
+
+
+def activation_token_hash(token):
+    """Stored form of a one-time activation token (only its hash is kept)."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PasswordHasher:
+    """Lazily started process pool computing ``generate_password_hash``."""
+
+    def __init__(self, max_workers=None, method=DEFAULT_METHOD):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.method = method
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: never fork a process holding MongoDB connections and threads
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def _replace_broken(self, executor):
+        """Drop a pool broken by a dead worker; the next call starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _hash(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    def submit(self, password):
+        """Start hashing one password; returns an object whose ``result()`` is the hash."""
+        executor = self._pool()
+        try:
+            future = executor.submit(generate_password_hash, password, method=self.method)
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            executor = self._pool()
+            future = executor.submit(generate_password_hash, password, method=self.method)
+        return _PendingHash(self, executor, future, password)
+
+    def map(self, passwords):
+        """Start hashing many passwords; returns an iterator of hashes in input order.
+
+        Work is submitted immediately, so the caller can do something else
+        before consuming the iterator.
+        """
+        passwords = list(passwords)
+        if not passwords:
+            return iter(())
+        chunksize = max(1, len(passwords) // (self.max_workers * 4))
+        executor = self._pool()
+        try:
+            hashes = executor.map(partial(generate_password_hash, method=self.method), passwords, chunksize=chunksize)
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            executor = self._pool()
+            hashes = executor.map(partial(generate_password_hash, method=self.method), passwords, chunksize=chunksize)
+        return self._hashes(executor, hashes, passwords)
+
+    def _hashes(self, executor, hashes, passwords):
+        done = 0
+        try:
+            for password_hash in hashes:
+                done += 1
+                yield password_hash
+        except BrokenProcessPool:
+            # The pool died under this batch: finish it here, later calls get a new pool
+            self._replace_broken(executor)
+            for password in passwords[done:]:
+                yield self._hash(password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class _PendingHash:
+    """Hash being computed on the pool, computed in the caller if the pool breaks."""
+
+    def __init__(self, hasher, executor, future, password):
+        self._hasher = hasher
+        self._executor = executor
+        self._future = future
+        self._password = password
+
+    def result(self):
+        try:
+            return self._future.result()
+        except BrokenProcessPool:
+            self._hasher._replace_broken(self._executor)
+            return self._hasher._hash(self._password)
+
+
+class LoginOverloaded(Exception):
+    """Too many password checks are already waiting."""
+
+
+class PasswordVerifier:
+    """Bounded executor for login-time password checks and rehashes."""
+
+    def __init__(self, max_workers=1, max_pending=8, method=DEFAULT_METHOD):
+        self.method = method
+        self.max_pending = max_pending
+        self.rejected = 0
+        self.rehashed = 0
+        self.pending = 0
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._prefix = None
+
+    def _pool(self):
+        # Created on first use, once the worker's serving mode is known
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = cpu_executor(self.max_workers, "password")
+        return self._executor
+
+    def _run(self, fn, *args):
+        # Admission control: refuse instead of queueing behind a burst
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise LoginOverloaded()
+        self.pending += 1
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    def verify(self, pwhash, password):
+        """check_password_hash on the executor; raises LoginOverloaded when full."""
+        return self._run(check_password_hash, pwhash, password)
+
+    def hash(self, password):
+        """generate_password_hash with the configured method, on the executor."""
+        return self._run(partial(generate_password_hash, method=self.method), password)
+
+    def needs_rehash(self, pwhash):
+        """Whether a stored hash was made with other parameters than the configured ones."""
+        if self._prefix is None:
+            # Werkzeug fills in default parameters: read them from a real hash once
+            self._prefix = generate_password_hash("", method=self.method).split("$", 1)[0]
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def stats(self):
+        return {"method": self.method, "max_pending": self.max_pending,
+                "rejected": self.rejected, "rehashed": self.rehashed}
@@ -0,0 +1,231 @@
+"""
+Content-addressed storage for rendered diploma PDFs.
+
+PDFs are keyed by a SHA-256 of the signed diploma content, so the same
+diploma always maps to the same object whichever worker or node asks for it.
+Every process serves files from a size-bounded LRU directory on local disk;
+an optional shared GridFS backend makes a diploma rendered once per cluster
+instead of once per node.
+
+The gunicorn workers of a node share the directory. File mtimes carry the
+recency, and a worker storing a PDF re-reads the directory if its last scan is
+older than ``rescan_seconds``, so the bound holds for the directory as a whole
+(give or take what other workers wrote since then), not per worker.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+# Files named after the diploma id, written before PDFs were content-addressed
+_LEGACY_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.pdf$")
+
+# Fields that may change after issuance without changing the rendered PDF
+_UNRENDERED_FIELDS = {"_id", "revoked", "revoked_at"}
+
+
+def pdf_key(diploma):
+    """Hash of the signed diploma content that identifies its PDF."""
+    content = {k: v for k, v in diploma.items() if k not in _UNRENDERED_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+# -----------------------------
+# LOCAL DISK (LRU)
+# -----------------------------
+class LocalPdfStore:
+    """Directory of ``<key>.pdf`` files evicted least-recently-used first."""
+
+    def __init__(self, directory, max_bytes, rescan_seconds=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = OrderedDict()  # key -> size, least recently used first
+        self._size = 0
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_legacy()
+        with self._lock:
+            self._scan()
+            self._evict()
+
+    def _remove_legacy(self):
+        # Never looked up again: each is re-rendered under its key on first use
+        for name in os.listdir(self.directory):
+            if _LEGACY_RE.match(name):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _scan(self):
+        """Rebuild the index from the directory (every worker's files), oldest access first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            key = name[:-4]
+            if name.endswith(".pdf") and _KEY_RE.match(key):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, key, stat.st_size))
+        self._index.clear()
+        self._size = 0
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        self._scanned_at = time.monotonic()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get_path(self, key):
+        """Return the local path of a stored PDF, or None on a miss."""
+        path = self.path(key)
+        with self._lock:
+            try:
+                # Touch the file so recency survives restarts and is shared between workers
+                os.utime(path)
+                size = self._index.pop(key, None)
+                if size is None:
+                    # Written by another worker sharing this directory
+                    size = os.path.getsize(path)
+                    self._size += size
+                self._index[key] = size
+                self.hits += 1
+                return path
+            except FileNotFoundError:
+                # Evicted by another worker
+                self._size -= self._index.pop(key, 0)
+                self.misses += 1
+                return None
+
+    def put(self, key, data):
+        """Store a PDF atomically and return its path."""
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._size += len(data)
+            # Other workers' writes only show up in a scan
+            if time.monotonic() - self._scanned_at >= self.rescan_seconds:
+                self._scan()
+            self._evict()
+        return path
+
+    def _evict(self):
+        # The most recent object is always kept, even if it alone exceeds the bound
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "objects": len(self._index),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes
+        }
+
+
+# -----------------------------
+# SHARED GRIDFS
+# -----------------------------
+class GridFSPdfStore:
+    """PDFs shared by every node through a MongoDB GridFS bucket."""
+
+    def __init__(self, db, bucket="pdfs"):
+        import gridfs
+        self.fs = gridfs.GridFS(db, collection=bucket)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        grid_out = self.fs.find_one({"filename": key})
+        if grid_out is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return grid_out.read()
+
+    def put(self, key, data):
+        # Another node may have stored the same diploma meanwhile
+        if not self.fs.exists({"filename": key}):
+            self.fs.put(data, filename=key, content_type="application/pdf")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+# -----------------------------
+# TIERED STORE
+# -----------------------------
+class PdfStore:
+    """Local LRU cache in front of an optional shared backend and the renderer."""
+
+    def __init__(self, local, render, shared=None):
+        self.local = local
+        self.shared = shared
+        # render(diploma) -> PDF bytes, only called on a cluster-wide miss
+        self.render = render
+        self.renders = 0
+
+    def lookup(self, diploma):
+        """Return a local path to the diploma's PDF if any tier has it, without rendering."""
+        return self.lookup_key(pdf_key(diploma))
+
+    def lookup_key(self, key):
+        """Same as :meth:`lookup` for a key computed earlier (e.g. carried by a download link)."""
+        path = self.local.get_path(key)
+        if path:
+            return path
+
+        data = self.shared.get(key) if self.shared else None
+        if data is None:
+            return None
+        return self.local.put(key, data)
+
+    def fetch(self, diploma):
+        """Return a local path to the diploma's PDF, rendering it only if no tier has it."""
+        path = self.lookup(diploma)
+        if path:
+            return path
+
+        data = self.render(diploma)
+        self.renders += 1
+        return self.put(diploma, data)
+
+    def put(self, diploma, data):
+        """Store a PDF rendered elsewhere (e.g. by the render pool) and return its path."""
+        key = pdf_key(diploma)
+        if self.shared:
+            self.shared.put(key, data)
+        return self.local.put(key, data)
+
+    def stats(self):
+        return {
+            "backend": "gridfs" if self.shared else "local",
+            "renders": self.renders,
+            "local": self.local.stats(),
+            "shared": self.shared.stats() if self.shared else None
+        }
@@ -0,0 +1,64 @@
+"""
+Structured, non-blocking logging.
+
+Request threads only put records on an in-memory queue; a listener thread
+formats them as one JSON object per line and writes them to stdout. A slow or
+blocked stdout therefore never delays a response.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+LOGGER_NAME = "lowtechdiploma"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; structured fields come from ``extra={"fields": {...}}``."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "msg": record.getMessage(),
+            "pid": record.process
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(_queue, stream)
+    _listener.start()
+
+
+def configure_logging(level="INFO"):
+    """Return the app logger, writing JSON lines to stdout through a queue.
+
+    The queue handler sits on the root logger, so module loggers
+    (``logging.getLogger(__name__)``) end up in the same JSON stream.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    root = logging.getLogger()
+    if _listener is None:
+        _start_listener()
+        # The listener thread does not survive a fork (e.g. gunicorn --preload)
+        os.register_at_fork(after_in_child=_start_listener)
+        # Write what is still queued at shutdown
+        atexit.register(lambda: _listener.stop())
+        root.addHandler(logging.handlers.QueueHandler(_queue))
+    logger.setLevel(level)
+    # Debug records of third-party libraries stay off
+    root.setLevel(max(logger.level, logging.INFO))
+    return logger
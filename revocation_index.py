@@ -0,0 +1,233 @@
+"""
+In-memory index of issued and revoked diplomas.
+
+Each worker keeps every issued diploma id as a 16-byte key in a sorted byte
+array (plus a small set of recent additions), the revoked ids in a set, and a
+Bloom filter in front to reject unknown ids cheaply. The index is loaded in a
+background thread on first use and kept up to date from a change stream on the
+``diplomas`` collection, falling back to polling when change streams are not
+available (standalone ``mongod``, or a transient error) and retrying the change
+stream every ``WATCH_RETRY_SECONDS``. ``/verify`` can then answer for known
+diplomas without a database round-trip.
+
+Revocations made by another worker are visible after at most
+``poll_interval`` seconds in polling mode, usually well under a second with
+change streams.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+# Recent additions are merged into the sorted array once the set grows past this
+COMPACT_THRESHOLD = 10000
+# While polling, the change stream is tried again after this long
+WATCH_RETRY_SECONDS = 60
+
+
+def _key(diploma_id):
+    """16-byte key of a diploma id: the UUID bytes, or a hash for other ids."""
+    try:
+        return uuid.UUID(diploma_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return hashlib.blake2b(str(diploma_id).encode(), digest_size=KEY_SIZE).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter (about 1% false positives at capacity)."""
+
+    HASHES = 7
+    BITS_PER_ITEM = 10
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1024)
+        self.size = self.capacity * self.BITS_PER_ITEM
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.HASHES)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationIndex:
+    """Issued/revoked diploma ids of this worker, synchronised from MongoDB."""
+
+    def __init__(self, collection, poll_interval=5.0):
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.ready = False
+        self.mode = None
+        self.last_sync = None
+        self._base = b""          # sorted concatenation of 16-byte keys
+        self._recent = set()      # keys added since the last compaction
+        self._revoked = set()
+        self._bloom = BloomFilter(0)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # -----------------------------
+    # LOOKUPS
+    # -----------------------------
+    def _in_base(self, key):
+        base = self._base
+        lo, hi = 0, len(base) // KEY_SIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = base[mid * KEY_SIZE:(mid + 1) * KEY_SIZE]
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def status(self, diploma_id):
+        """Return "valid", "revoked" or "unknown", or None while the index is loading."""
+        self.ensure_started()
+        if not self.ready:
+            return None
+        key = _key(diploma_id)
+        if key not in self._bloom or not (key in self._recent or self._in_base(key)):
+            return "unknown"
+        return "revoked" if key in self._revoked else "valid"
+
+    # -----------------------------
+    # UPDATES
+    # -----------------------------
+    def add(self, diploma_id, revoked=False):
+        key = _key(diploma_id)
+        with self._lock:
+            if key not in self._recent and not self._in_base(key):
+                self._recent.add(key)
+                self._bloom.add(key)
+                self._count += 1
+            if revoked:
+                self._revoked.add(key)
+            if len(self._recent) >= COMPACT_THRESHOLD:
+                self._compact()
+
+    def revoke(self, diploma_id):
+        self.add(diploma_id, revoked=True)
+
+    def _compact(self):
+        keys = sorted(self._recent | {self._base[i:i + KEY_SIZE] for i in range(0, len(self._base), KEY_SIZE)})
+        self._base = b"".join(keys)
+        self._recent = set()
+        # Grow the Bloom filter before it degrades
+        if len(keys) > self._bloom.capacity:
+            bloom = BloomFilter(len(keys) * 2)
+            for key in keys:
+                bloom.add(key)
+            self._bloom = bloom
+
+    def _load(self):
+        """Full load of every issued id and revocation flag."""
+        keys = []
+        revoked = set()
+        for doc in self.collection.find({}, {"_id": 0, "id": 1, "revoked": 1}).batch_size(10000):
+            key = _key(doc.get("id"))
+            keys.append(key)
+            if doc.get("revoked", False):
+                revoked.add(key)
+        keys = sorted(set(keys))
+        bloom = BloomFilter(len(keys) * 2)
+        for key in keys:
+            bloom.add(key)
+        with self._lock:
+            self._base = b"".join(keys)
+            self._recent = set()
+            self._revoked = revoked
+            self._bloom = bloom
+            self._count = len(keys)
+        self.ready = True
+        self.last_sync = time.time()
+
+    # -----------------------------
+    # SYNCHRONISATION
+    # -----------------------------
+    def ensure_started(self):
+        # Started lazily so the thread exists in each gunicorn worker, not only the master
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._sync_forever, name="revocation-index", daemon=True)
+                    self._thread.start()
+
+    def _sync_forever(self):
+        while True:
+            loaded_at = datetime.utcnow()
+            try:
+                self._watch()
+            except Exception as e:
+                # Logged once per fallback, not on every retry
+                if self.mode != "polling":
+                    logger.warning("change stream unavailable, polling", extra={"fields": {
+                        "error": str(e), "poll_interval_s": self.poll_interval
+                    }})
+            try:
+                if not self.ready:
+                    loaded_at = datetime.utcnow()
+                    self._load()
+                self._poll(loaded_at, time.monotonic() + WATCH_RETRY_SECONDS)
+            except Exception as e:
+                logger.warning("revocation index polling failed", extra={"fields": {"error": str(e)}})
+                time.sleep(self.poll_interval)
+
+    def _watch(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        # The stream is opened before the full load so no change falls in between
+        with self.collection.watch(pipeline, full_document="updateLookup") as stream:
+            self._load()
+            self.mode = "change_stream"
+            logger.info("revocation index loaded", extra={"fields": {
+                "diplomas": self._count, "revoked": len(self._revoked)
+            }})
+            for change in stream:
+                doc = change.get("fullDocument")
+                if doc and doc.get("id"):
+                    self.add(doc["id"], revoked=doc.get("revoked", False))
+                self.last_sync = time.time()
+
+    def _poll(self, last_poll, until):
+        """Apply changes every ``poll_interval`` seconds until the ``until`` monotonic time."""
+        self.mode = "polling"
+        while time.monotonic() < until:
+            time.sleep(self.poll_interval)
+            started = datetime.utcnow()
+            # ObjectIds are generated by several processes: overlap the window a little
+            since = ObjectId.from_datetime(last_poll - timedelta(seconds=60))
+            for doc in self.collection.find({"_id": {"$gte": since}}, {"_id": 0, "id": 1, "revoked": 1}):
+                self.add(doc.get("id"), revoked=doc.get("revoked", False))
+            # Revocations are rare: reload the whole set
+            revoked = {_key(doc.get("id")) for doc in self.collection.find({"revoked": True}, {"_id": 0, "id": 1})}
+            with self._lock:
+                self._revoked = revoked
+            last_poll = started
+            self.last_sync = time.time()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "diplomas": self._count,
+            "revoked": len(self._revoked),
+            "seconds_since_sync": round(time.time() - self.last_sync, 3) if self.last_sync else None
+        }
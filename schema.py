@@ -0,0 +1,143 @@
+"""
+Declared MongoDB indexes and a query-plan audit of the hot lookups.
+
+The app calls :func:`ensure_indexes` at boot. The audit runs ``explain()`` on
+every hot query and flags collection scans; it is available as
+``GET /admin/query_plans`` and from the command line::
+
+    MONGO_URI=... python schema.py ensure
+    MONGO_URI=... python schema.py audit
+"""
+import json
+import logging
+import os
+import sys
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# INDEXES
+# -----------------------------
+INDEXES = {
+    "diplomas": [
+        # verify / get / download / revoke, and keyset pagination of /list
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # /list for students, sorted by id
+        IndexModel([("student_name", ASCENDING), ("id", ASCENDING)], name="student_name_id"),
+        # /download_batch date filters
+        IndexModel([("issued_at", ASCENDING)], name="issued_at"),
+    ],
+    "users": [
+        # login and account lookups during issuance
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # /activate, only accounts awaiting activation carry a token
+        IndexModel([("activation.token_hash", ASCENDING)], name="activation_token_hash", unique=True, sparse=True),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "fingerprints": [
+        # bulk re-uploads: one issued diploma per normalised (name, email, degree)
+        IndexModel([("fingerprint", ASCENDING)], name="fingerprint_unique", unique=True),
+    ],
+    "idempotency_keys": [
+        # Idempotency-Key replays, per school account
+        IndexModel([("owner", ASCENDING), ("key", ASCENDING)], name="owner_key_unique", unique=True),
+        # stored responses can be replayed for 24 hours
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=24 * 3600),
+    ],
+    "outbox": [
+        # delivery worker claims due messages in order
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+        # sent messages only keep metadata, dropped after 30 days
+        IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+}
+
+# -----------------------------
+# HOT QUERIES
+# -----------------------------
+# (description, collection, filter, sort)
+HOT_QUERIES = [
+    ("verify / get / download by id", "diplomas", {"id": "00000000-0000-0000-0000-000000000000"}, None),
+    ("list (school)", "diplomas", {}, [("id", ASCENDING)]),
+    ("list (student)", "diplomas", {"student_name": "audit"}, [("id", ASCENDING)]),
+    ("download_batch by issue date", "diplomas", {"issued_at": {"$gte": "2000-01-01"}}, [("issued_at", ASCENDING)]),
+    ("login / issuance user lookup", "users", {"username": "audit"}, None),
+    ("bulk issuance name resolution", "users", {"username": {"$in": ["audit"]}}, None),
+    ("account activation", "users", {"activation.token_hash": "audit"}, None),
+    ("job progress", "jobs", {"id": "audit"}, None),
+    ("bulk re-upload fingerprint lookup", "fingerprints", {"fingerprint": {"$in": ["audit"]}}, None),
+    ("idempotency key lookup", "idempotency_keys", {"owner": "audit", "key": "audit"}, None),
+    ("outbox claim", "outbox", {"status": "pending", "next_attempt_at": {"$lte": "2000-01-01"}}, [("next_attempt_at", ASCENDING)]),
+]
+
+
+def ensure_indexes(db):
+    """Create every declared index that does not exist yet.
+
+    A failing index (e.g. duplicates preventing a unique index) is reported
+    and skipped so the app can still start.
+    """
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection].create_indexes([index])
+            except OperationFailure as e:
+                logger.warning("could not create index", extra={"fields": {
+                    "collection": collection, "index": index.document["name"], "error": str(e)
+                }})
+
+
+def _stages(plan):
+    """All stage names of an explain plan, whatever its nesting."""
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages.extend(_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    return []
+
+
+def audit_queries(db):
+    """Explain every hot query and flag the ones that scan a whole collection."""
+    report = []
+    for description, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = _stages(winning_plan)
+        report.append({
+            "query": description,
+            "collection": collection,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages
+        })
+    return report
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ("ensure", "audit"):
+        print("Usage: python schema.py ensure|audit")
+        sys.exit(2)
+
+    db = MongoClient(os.environ["MONGO_URI"], serverSelectionTimeoutMS=5000).lowtechdiploma
+    if sys.argv[1] == "ensure":
+        ensure_indexes(db)
+        print("Indexes ensured")
+    else:
+        report = audit_queries(db)
+        print(json.dumps(report, indent=2))
+        scans = [entry["query"] for entry in report if entry["collection_scan"]]
+        if scans:
+            print(f"❌ Collection scans: {', '.join(scans)}")
+            sys.exit(1)
+        print("✅ No collection scans")
@@ -1,9 +1,49 @@
 # Script to ensure frontend is built before running the app
 
+import gzip
 import os
 import subprocess
 import sys
 
+# Text assets worth precompressing; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.map', '.xml', '.ico', '.wasm'}
+MIN_COMPRESS_SIZE = 1024
+
+def precompress(dist_path):
+    """Write .gz (and .br when the brotli package is installed) next to every text asset"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("⚠️  brotli not installed - only gzip variants will be written")
+
+    written = 0
+    for folder, _, files in os.walk(dist_path):
+        for name in files:
+            path = os.path.join(folder, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            if os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            with open(path, 'rb') as fp:
+                data = fp.read()
+
+            variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli:
+                variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+            for suffix, compress in variants:
+                target = path + suffix
+                # Up to date from a previous run
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                compressed = compress(data)
+                # Only keep variants that actually save bytes
+                if len(compressed) < len(data):
+                    with open(target, 'wb') as fp:
+                        fp.write(compressed)
+                    written += 1
+    print(f"✅ Precompressed assets ({written} files written)")
+
 def build_frontend():
     """Build the React frontend if dist/ doesn't exist"""
     
@@ -14,6 +54,7 @@ def build_frontend():
     # Check if dist exists and has files
     if os.path.exists(dist_path) and os.listdir(dist_path):
         print("✅ Frontend already built (dist/ exists)")
+        precompress(dist_path)
         return True
     
     print("🏗️  Building React frontend...")
@@ -35,6 +76,7 @@ def build_frontend():
     try:
         subprocess.run(['npm', 'run', 'build'], check=True, cwd=root_dir)
         print("✅ Frontend built successfully!")
+        precompress(dist_path)
         return True
     except subprocess.CalledProcessError as e:
         print(f"❌ Failed to build frontend: {e}")
@@ -0,0 +1,64 @@
+"""
+CPU-bound work under the gevent worker.
+
+With ``GUNICORN_WORKER_CLASS=gevent`` every request is a greenlet: waiting on
+MongoDB or SMTP only parks that greenlet, so one process keeps hundreds of
+requests in flight. All greenlets of a worker share one OS thread, though, and
+CPU-bound calls (password KDFs, PDF rendering, large batches of signature
+checks) would stall every other request meanwhile. They go through the
+executors below, which always use native threads; with the default threaded
+workers they behave like plain thread pools or direct calls.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def cooperative():
+    """Whether this process runs under gevent's monkey-patching (gevent worker)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def serving_mode():
+    return "gevent" if cooperative() else "threads"
+
+
+def cpu_executor(max_workers, thread_name_prefix=""):
+    """Thread pool of native threads, even when ``threading`` is patched by gevent."""
+    if cooperative():
+        # Its futures can be waited on from a greenlet without blocking the hub
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+
+class CpuOffload:
+    """Runs CPU-bound calls on native threads when the worker is cooperative."""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.offloaded = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created on first use, after gunicorn forked and gevent patched the worker
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = cpu_executor(self.max_workers, "cpu")
+        return self._executor
+
+    def run(self, fn, *args, **kwargs):
+        """``fn(*args, **kwargs)``, off the event loop if there is one."""
+        if not cooperative():
+            return fn(*args, **kwargs)
+        self.offloaded += 1
+        return self._pool().submit(fn, *args, **kwargs).result()
+
+    def stats(self):
+        return {"mode": serving_mode(), "cpu_threads": self.max_workers, "offloaded": self.offloaded}
@@ -5,6 +5,7 @@ import { DiplomaProvider } from '@/app/contexts/DiplomaContext';
 import { Layout } from '@/app/components/Layout';
 import { HomePage } from '@/app/pages/HomePage';
 import { LoginPage } from '@/app/pages/LoginPage';
+import { ActivatePage } from '@/app/pages/ActivatePage';
 import { IssuancePage } from '@/app/pages/IssuancePage';
 import { VerificationPage } from '@/app/pages/VerificationPage';
 import { StudentDashboard } from '@/app/pages/StudentDashboard';
@@ -18,6 +19,7 @@ export default function App() {
           <Routes>
             <Route path="/" element={<HomePage />} />
             <Route path="/login" element={<LoginPage />} />
+            <Route path="/activate" element={<ActivatePage />} />
             <Route path="/verify" element={<VerificationPage />} />
             <Route path="/issue" element={<IssuancePage />} />
             <Route path="/my-diplomas" element={<StudentDashboard />} />
@@ -62,18 +62,27 @@ export const DiplomaProvider = ({ children }: { children: ReactNode }) => {
     }
 
     try {
-      const response = await fetch(`${API_BASE_URL}/list`, {
-        headers: {
-          'Authorization': currentToken,
-        },
-      });
-
-      if (response.ok) {
-        const data = await response.json();
-        setDiplomas(data);
-      } else {
-        setDiplomas([]);
-      }
+      // /list is paginated: follow next_after until the last page
+      const all: Diploma[] = [];
+      let after: string | null = null;
+      do {
+        const params = new URLSearchParams({ limit: '500' });
+        if (after) params.set('after', after);
+        const response = await fetch(`${API_BASE_URL}/list?${params}`, {
+          headers: {
+            'Authorization': currentToken,
+          },
+        });
+
+        if (!response.ok) {
+          setDiplomas([]);
+          return;
+        }
+        const page: { items: Diploma[]; next_after: string | null } = await response.json();
+        all.push(...page.items);
+        after = page.next_after;
+      } while (after);
+      setDiplomas(all);
     } catch (error) {
       console.error('Failed to load diplomas:', error);
       setDiplomas([]);
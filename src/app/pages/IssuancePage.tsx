@@ -7,15 +7,23 @@ import { API_BASE_URL } from '@/config';
 
 type TabType = 'single' | 'bulk';
 
+// Stop following a bulk import whose progress has not moved for this long
+const JOB_STALL_TIMEOUT_MS = 10 * 60 * 1000;
+
 interface BulkResult {
-  total: number;
+  status: string;
+  // null until the job has counted the rows of the file
+  total: number | null;
+  done: number;
   success: number;
+  skipped: number;
   failed: number;
+  rows_per_second: number;
   details: Array<{
     student: string;
     status: string;
     diploma_id?: string;
-    email_sent?: boolean;
+    email_queued?: boolean;
     error?: string;
   }>;
 }
@@ -119,13 +127,36 @@ export const IssuancePage = () => {
         throw new Error(errorData.error || 'Erreur lors de l\'import');
       }
 
-      const result = await response.json();
-      setBulkResult(result);
+      const { job_id } = await response.json();
       setSelectedFile(null);
       
       // Reset file input
       const fileInput = document.getElementById('bulk-file-input') as HTMLInputElement;
       if (fileInput) fileInput.value = '';
+
+      // The import runs as a background job: poll its progress until it ends
+      let job: BulkResult;
+      let lastDone = -1;
+      let lastProgressAt = Date.now();
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(`${API_BASE_URL}/jobs/${job_id}`, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+          },
+        });
+        if (!jobResponse.ok) {
+          throw new Error('Impossible de suivre la progression de l\'import');
+        }
+        job = await jobResponse.json();
+        setBulkResult(job);
+        if (job.done !== lastDone) {
+          lastDone = job.done;
+          lastProgressAt = Date.now();
+        } else if (Date.now() - lastProgressAt > JOB_STALL_TIMEOUT_MS) {
+          throw new Error('L\'import ne progresse plus, consultez la liste des diplômes avant de le relancer');
+        }
+      } while (job.status === 'queued' || job.status === 'running');
       
     } catch (err: any) {
       setError(err.message || 'Une erreur est survenue lors de l\'import en masse');
@@ -337,15 +368,19 @@ export const IssuancePage = () => {
                 {bulkResult && (
                   <div className="bg-blue-50 border border-blue-200 rounded-lg p-6">
                     <h3 className="font-semibold text-blue-900 mb-3">Résultat de l'import</h3>
-                    <div className="grid grid-cols-3 gap-4 mb-4">
+                    <div className="grid grid-cols-4 gap-4 mb-4">
                       <div className="bg-white rounded-lg p-3 text-center">
-                        <div className="text-2xl font-bold text-gray-700">{bulkResult.total}</div>
+                        <div className="text-2xl font-bold text-gray-700">{bulkResult.total ?? '…'}</div>
                         <div className="text-xs text-gray-600">Total</div>
                       </div>
                       <div className="bg-green-50 rounded-lg p-3 text-center">
                         <div className="text-2xl font-bold text-green-700">{bulkResult.success}</div>
                         <div className="text-xs text-green-600">Réussis</div>
                       </div>
+                      <div className="bg-gray-50 rounded-lg p-3 text-center">
+                        <div className="text-2xl font-bold text-gray-500">{bulkResult.skipped ?? 0}</div>
+                        <div className="text-xs text-gray-500">Déjà émis</div>
+                      </div>
                       <div className="bg-red-50 rounded-lg p-3 text-center">
                         <div className="text-2xl font-bold text-red-700">{bulkResult.failed}</div>
                         <div className="text-xs text-red-600">Échoués</div>
@@ -362,21 +397,23 @@ export const IssuancePage = () => {
                               className={`text-sm p-2 rounded ${
                                 detail.status === 'success'
                                   ? 'bg-green-50 text-green-800'
-                                  : 'bg-red-50 text-red-800'
+                                  : detail.status === 'skipped'
+                                    ? 'bg-gray-50 text-gray-600'
+                                    : 'bg-red-50 text-red-800'
                               }`}
                             >
                               <div className="flex items-start justify-between">
                                 <span className="font-medium">{detail.student}</span>
                                 <span className="text-xs">
-                                  {detail.status === 'success' ? '✓' : '✗'}
+                                  {detail.status === 'success' ? '✓' : detail.status === 'skipped' ? 'déjà émis' : '✗'}
                                 </span>
                               </div>
                               {detail.error && (
                                 <div className="text-xs mt-1 text-red-600">{detail.error}</div>
                               )}
-                              {detail.email_sent !== undefined && (
+                              {detail.email_queued !== undefined && (
                                 <div className="text-xs mt-1">
-                                  Email: {detail.email_sent ? '✓ envoyé' : '✗ non envoyé'}
+                                  Email: {detail.email_queued ? "✓ en file d'envoi" : "✗ non envoyé"}
                                 </div>
                               )}
                             </div>
@@ -390,7 +427,7 @@ export const IssuancePage = () => {
                 <div className="bg-blue-50 border border-blue-200 rounded-lg p-4">
                   <h3 className="font-semibold text-blue-900 mb-2">Format du fichier</h3>
                   <p className="text-sm text-blue-800 mb-3">
-                    Le fichier doit être au format CSV ou Excel (.xlsx, .xls) avec les colonnes suivantes :
+                    Le fichier doit être au format CSV ou Excel (.xlsx) avec les colonnes suivantes :
                   </p>
                   <ul className="text-sm text-blue-800 space-y-1 mb-3 list-disc list-inside">
                     <li><code className="bg-blue-100 px-1 rounded">student_name</code> - Nom de l'étudiant</li>
@@ -414,7 +451,7 @@ export const IssuancePage = () => {
                     <input
                       id="bulk-file-input"
                       type="file"
-                      accept=".csv,.xlsx,.xls"
+                      accept=".csv,.xlsx"
                       onChange={handleFileChange}
                       className="block w-full text-sm text-gray-500 file:mr-4 file:py-3 file:px-4 file:rounded-lg file:border-0 file:text-sm file:font-medium file:bg-gray-100 file:text-gray-700 hover:file:bg-gray-200 transition-colors"
                     />
@@ -434,7 +471,9 @@ export const IssuancePage = () => {
                   {bulkLoading ? (
                     <>
                       <div className="animate-spin rounded-full h-5 w-5 border-b-2 border-white"></div>
-                      Import en cours...
+                      {bulkResult
+                        ? `Import en cours... ${bulkResult.done}/${bulkResult.total ?? '…'} (${bulkResult.rows_per_second} lignes/s)`
+                        : 'Import en cours...'}
                     </>
                   ) : (
                     <>
@@ -9,4 +9,5 @@ export const API_ENDPOINTS = {
   MY_DIPLOMAS: '/list',
   ALL_DIPLOMAS: '/list',
   DOWNLOAD_DIPLOMA: '/download',
+  DOWNLOAD_BATCH: '/download_batch',
 };
@@ -16,6 +16,12 @@ else
     echo "✅ dist/ folder already exists, skipping build"
 fi
 
+# Precompress text assets (gzip/brotli) served by the static manifest
+python scripts/build_frontend.py
+
 # Start Flask with gunicorn
 echo "🐍 Starting Flask application..."
-exec gunicorn app:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+# Threaded workers keep serving other routes while a login waits on its password check;
+# GUNICORN_WORKER_CLASS=gevent serves each request as a greenlet (many more in flight per worker)
+exec gunicorn 'app:create_app()' --bind 0.0.0.0:$PORT --workers 2 --threads ${GUNICORN_THREADS:-4} \
+    --worker-class ${GUNICORN_WORKER_CLASS:-gthread} --worker-connections ${GUNICORN_WORKER_CONNECTIONS:-1000} --timeout 120
@@ -0,0 +1,128 @@
+"""
+In-memory manifest of the built frontend (``dist/``).
+
+The tree is scanned once at startup: every file gets its content type, an
+ETag and its precompressed ``.br`` / ``.gz`` variants (written by
+``scripts/build_frontend.py``), and ``index.html`` is kept in memory. Serving
+an asset then needs no filesystem lookups besides opening the chosen file.
+Vite's content-hashed files are cached by browsers for a year; everything
+else is revalidated with its ETag.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, send_file
+
+# Vite appends a content hash to asset names, e.g. index-B3x9_kLq.js
+_HASHED_NAME_RE = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class StaticAsset:
+    def __init__(self, path, relpath):
+        with open(path, "rb") as fp:
+            data = fp.read()
+        self.path = path
+        self.etag = _etag(data)
+        self.mimetype = mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+        self.immutable = relpath.startswith("assets/") and bool(_HASHED_NAME_RE.search(relpath))
+        self.variants = {
+            encoding: path + suffix
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        }
+
+    def pick(self, accept_encodings):
+        """Return (path, encoding) of the best variant the client accepts."""
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and accept_encodings[encoding]:
+                return self.variants[encoding], encoding
+        return self.path, None
+
+
+class StaticManifest:
+    """Files of ``dist/`` with their headers, scanned once."""
+
+    def __init__(self, dist_path):
+        self.dist_path = dist_path
+        self.assets = {}
+        self.index = None
+        self.index_variants = {}
+        self.available = os.path.isdir(dist_path)
+        if self.available:
+            self._scan()
+
+    def _scan(self):
+        compressed_suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        for folder, _, files in os.walk(self.dist_path):
+            for name in files:
+                if name.endswith(compressed_suffixes):
+                    continue
+                path = os.path.join(folder, name)
+                relpath = os.path.relpath(path, self.dist_path).replace(os.sep, "/")
+                self.assets[relpath] = StaticAsset(path, relpath)
+
+        index = self.assets.get("index.html")
+        if index:
+            with open(index.path, "rb") as fp:
+                self.index = fp.read()
+            for encoding, variant in index.variants.items():
+                with open(variant, "rb") as fp:
+                    self.index_variants[encoding] = fp.read()
+
+    def serve(self, relpath, request):
+        """Response for a file of dist/, or None if it is not part of the build."""
+        asset = self.assets.get(relpath)
+        if asset is None:
+            return None
+        path, encoding = asset.pick(request.accept_encodings)
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+        response = send_file(path, mimetype=asset.mimetype, etag=etag, conditional=True)
+        return self._finish(response, asset, encoding)
+
+    def serve_index(self, request):
+        """index.html from memory, for every SPA route."""
+        asset = self.assets["index.html"]
+        encoding = next(
+            (encoding for encoding, _ in ENCODINGS
+             if encoding in self.index_variants and request.accept_encodings[encoding]),
+            None
+        )
+        body = self.index_variants[encoding] if encoding else self.index
+        response = Response(body, mimetype=asset.mimetype)
+        response.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        response.make_conditional(request)
+        return self._finish(response, asset, encoding)
+
+    @staticmethod
+    def _finish(response, asset, encoding):
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if asset.variants:
+            response.vary.add("Accept-Encoding")
+        response.cache_control.no_cache = None
+        if asset.immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            # index.html and unhashed files: revalidate with the ETag every time
+            response.cache_control.no_cache = True
+        return response
+
+    def stats(self):
+        return {
+            "files": len(self.assets),
+            "immutable": sum(1 for asset in self.assets.values() if asset.immutable),
+            "precompressed": sum(1 for asset in self.assets.values() if asset.variants),
+            "index_cached": self.index is not None
+        }
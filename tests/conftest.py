@@ -0,0 +1,41 @@
+"""
+Shared fixtures: app.py imported once, on an in-process mongomock database.
+"""
+import pytest
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The ``app`` module, started against mongomock (no MongoDB server, no SMTP)."""
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+
+    shared = mongomock.MongoClient()
+    patch = pytest.MonkeyPatch()
+    # app.py passes server options mongomock does not know about
+    patch.setattr(pymongo, "MongoClient", lambda *args, **kwargs: shared)
+    patch.setenv("JWT_SECRET", "test-secret")
+    patch.setenv("MONGO_URI", "mongodb://mongomock")
+    patch.setenv("PDFS_DIR", str(tmp_path_factory.mktemp("pdfs")))
+    patch.setenv("METRICS_DIR", str(tmp_path_factory.mktemp("metrics")))
+    # diploma_states() then always reads MongoDB; the index has its own tests
+    patch.setenv("REVOCATION_INDEX", "False")
+    for name in ("MAIL_USERNAME", "MAIL_PDF_MODE", "ACCOUNT_ACTIVATION", "PUBLIC_URL"):
+        patch.delenv(name, raising=False)
+
+    import app as server
+    server.create_app()
+    yield server
+    patch.undo()
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def school(client):
+    """Authorization header of the default school account."""
+    response = client.post("/login", json={"username": "school", "password": "schoolpass"})
+    return {"Authorization": f"Bearer {response.get_json()['token']}"}
@@ -0,0 +1,75 @@
+"""
+Fingerprint claims of bulk rows: dedupe, release of revoked and abandoned claims.
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+from bulk_ingest import row_fingerprint
+
+
+def rows(count, degree="Master"):
+    prefix = uuid.uuid4().hex[:8]
+    return [{"student_name": f"{prefix}-{n}", "student_email": f"{prefix}-{n}@example.org",
+             "degree_name": degree} for n in range(count)]
+
+
+def test_new_rows_are_claimed_once(server):
+    batch = rows(3)
+    claimed, diploma_ids, details = server.claim_bulk_rows(batch)
+    assert claimed == batch and details == []
+    assert len(set(diploma_ids)) == 3
+    stored = server.fingerprints_collection.find_one({"fingerprint": row_fingerprint(batch[0])})
+    assert stored["diploma_id"] == diploma_ids[0]
+
+    # The same file uploaded again: every row is skipped with its reserved diploma
+    claimed, _, details = server.claim_bulk_rows(batch)
+    assert claimed == []
+    assert [(d["status"], d["diploma_id"]) for d in details] == [("skipped", i) for i in diploma_ids]
+
+
+def test_repeated_row_in_one_file_is_issued_once(server):
+    row, = rows(1)
+    same = dict(row, student_name=row["student_name"].upper() + " ")
+    claimed, diploma_ids, details = server.claim_bulk_rows([row, same])
+    assert claimed == [row]
+    assert details == [{"student": same["student_name"], "status": "skipped", "diploma_id": diploma_ids[0]}]
+
+
+def test_revoked_diploma_releases_its_row(server):
+    row, = rows(1)
+    _, (diploma_id,), _ = server.claim_bulk_rows([row])
+    server.diplomas_collection.insert_one({"id": diploma_id, "student_name": row["student_name"], "revoked": True})
+
+    claimed, (new_id,), details = server.claim_bulk_rows([row])
+    assert claimed == [row] and details == []
+    assert new_id != diploma_id
+
+
+def test_issued_diploma_keeps_its_claim(server):
+    row, = rows(1)
+    _, (diploma_id,), _ = server.claim_bulk_rows([row])
+    server.diplomas_collection.insert_one({"id": diploma_id, "student_name": row["student_name"], "revoked": False})
+    server.fingerprints_collection.update_one(
+        {"diploma_id": diploma_id}, {"$set": {"claimed_at": datetime.utcnow() - timedelta(days=1)}}
+    )
+    claimed, _, details = server.claim_bulk_rows([row])
+    assert claimed == [] and details[0]["diploma_id"] == diploma_id
+
+
+def test_claim_of_an_interrupted_job_expires(server):
+    row, = rows(1)
+    _, (diploma_id,), _ = server.claim_bulk_rows([row])
+
+    # No diploma yet: a job is still working on it
+    assert server.claim_bulk_rows([row])[0] == []
+
+    server.fingerprints_collection.update_one(
+        {"diploma_id": diploma_id},
+        {"$set": {"claimed_at": datetime.utcnow() - server.BULK_CLAIM_TIMEOUT - timedelta(minutes=1)}}
+    )
+    claimed, (new_id,), _ = server.claim_bulk_rows([row])
+    assert claimed == [row] and new_id != diploma_id
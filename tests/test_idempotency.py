@@ -0,0 +1,63 @@
+"""
+``Idempotency-Key`` on /issue: replay, request still running, key reused for another body.
+"""
+import json
+import uuid
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+
+def body():
+    return {
+        "student_name": f"student-{uuid.uuid4().hex[:8]}",
+        "student_email": "student@example.org",
+        "degree_name": "Master"
+    }
+
+
+def with_key(school, key):
+    return {**school, "Idempotency-Key": key}
+
+
+def test_retry_replays_the_first_response(server, client, school):
+    key = str(uuid.uuid4())
+    request = body()
+    first = client.post("/issue", headers=with_key(school, key), json=request)
+    retry = client.post("/issue", headers=with_key(school, key), json=request)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.get_json() == first.get_json()
+    assert server.diplomas_collection.count_documents({"student_name": request["student_name"]}) == 1
+
+
+def test_key_reused_for_a_different_request_is_refused(client, school):
+    key = str(uuid.uuid4())
+    assert client.post("/issue", headers=with_key(school, key), json=body()).status_code == 200
+    response = client.post("/issue", headers=with_key(school, key), json=body())
+    assert response.status_code == 422
+
+
+def test_retry_while_the_first_request_runs_gets_409(server, client, school):
+    key = str(uuid.uuid4())
+    request = body()
+    data = json.dumps(request).encode()
+    # Claimed by a first request that has not answered yet
+    server.idempotency.claim("school", key, server.request_hash("POST", "/issue", data))
+
+    response = client.post("/issue", headers=with_key(school, key), data=data, content_type="application/json")
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert server.diplomas_collection.count_documents({"student_name": request["student_name"]}) == 0
+
+
+def test_keys_are_scoped_to_their_owner(server, client, school):
+    key = str(uuid.uuid4())
+    server.idempotency.claim("someone-else", key, "other request")
+    assert client.post("/issue", headers=with_key(school, key), json=body()).status_code == 200
+
+
+def test_invalid_key_is_rejected(client, school):
+    assert client.post("/issue", headers=with_key(school, "x" * 300), json=body()).status_code == 400
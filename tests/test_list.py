@@ -0,0 +1,41 @@
+"""
+Keyset pagination of /list.
+"""
+import pytest
+
+pytest.importorskip("mongomock")
+
+
+def test_pages_follow_next_after_without_gaps_or_repeats(server, client, school):
+    server.diplomas_collection.insert_many([
+        {"id": f"list-{n:03d}", "student_name": "list-student", "degree_name": "Master", "revoked": False}
+        for n in range(7)
+    ])
+    seen = []
+    after = "list-"
+    while after and after.startswith("list-"):
+        page = client.get(f"/list?limit=3&after={after}", headers=school).get_json()
+        assert len(page["items"]) <= 3
+        if page["next_after"]:
+            assert page["next_after"] == page["items"][-1]["id"]
+        # Other tests' diplomas sort after these ones
+        seen += [item["id"] for item in page["items"] if item["id"].startswith("list-")]
+        after = page["next_after"]
+    assert seen == [f"list-{n:03d}" for n in range(7)]
+
+
+def test_last_page_has_no_next_after(server, client, school):
+    last = max(doc["id"] for doc in server.diplomas_collection.find({}, {"id": 1}))
+    response = client.get(f"/list?limit=5&after={last}", headers=school).get_json()
+    assert response == {"items": [], "next_after": None}
+
+
+def test_student_pages_only_list_their_diplomas(server, client):
+    server.diplomas_collection.insert_many([
+        {"id": f"own-{n}", "student_name": "alice", "degree_name": "Master", "revoked": False} for n in range(3)
+    ])
+    token = client.post("/login", json={"username": "alice", "password": "alicepass"}).get_json()["token"]
+    response = client.get("/list?limit=2&after=own-", headers={"Authorization": f"Bearer {token}"}).get_json()
+    assert [item["id"] for item in response["items"]] == ["own-0", "own-1"]
+    assert response["next_after"] == "own-1"
+    assert {item["student_name"] for item in response["items"]} == {"alice"}
@@ -0,0 +1,220 @@
+"""
+Outbox delivery against a local fake SMTP server (no network, no MongoDB server).
+
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+"""
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+from flask import Flask
+from flask_mail import Mail
+
+from outbox import Outbox
+
+
+class FakeSmtp(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server; ``reject`` makes it refuse the next messages with a 451."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.received = []
+        self.reject = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 fake")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 fake")
+            elif command == b"DATA":
+                if self.server.reject:
+                    self.server.reject -= 1
+                    self.reply("451 try again later")
+                    continue
+                self.reply("354 end with .")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    data.append(line)
+                self.server.received.append(b"".join(data))
+                self.reply("250 queued")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp():
+    server = FakeSmtp()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outbox(smtp):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=smtp.server_address[1],
+                      MAIL_DEFAULT_SENDER="school@example.org")
+    mail = Mail(app)
+    db = mongomock.MongoClient().lowtechdiploma
+    box = Outbox(db.outbox, lambda: mail, app.app_context, rate_per_minute=0,
+                 max_attempts=3, backoff_seconds=30, rate_collection=db.outbox_rate)
+    # Deliveries are driven by the test, not by the background thread
+    box._thread = threading.current_thread()
+    return box
+
+
+def queue(outbox, count):
+    return [outbox.enqueue(f"Diplome {i}", [f"student{i}@example.org"], f"Bonjour {i}") for i in range(count)]
+
+
+def message(outbox, message_id):
+    return outbox.collection.find_one({"id": message_id})
+
+
+def make_due(outbox, message_id):
+    outbox.collection.update_one({"id": message_id}, {"$set": {"next_attempt_at": datetime.utcnow()}})
+
+
+def test_batch_is_delivered_and_bodies_removed(outbox, smtp):
+    ids = queue(outbox, 3)
+
+    assert outbox.deliver_batch() == 3
+    assert len(smtp.received) == 3
+    for message_id in ids:
+        doc = message(outbox, message_id)
+        assert doc["status"] == "sent"
+        assert doc["attempts"] == 1
+        assert "body" not in doc and "attachments" not in doc
+    assert outbox.deliver_batch() == 0
+
+
+def test_send_failure_is_retried_with_backoff(outbox, smtp):
+    first, second = queue(outbox, 2)
+    smtp.reject = 1
+
+    before = datetime.utcnow()
+    assert outbox.deliver_batch() == 0
+    doc = message(outbox, first)
+    assert doc["status"] == "pending"
+    assert doc["attempts"] == 1
+    assert "451" in doc["last_error"]
+    assert doc["next_attempt_at"] >= before + timedelta(seconds=29)
+    # The rest of the batch is released untouched
+    assert message(outbox, second)["status"] == "pending"
+    assert message(outbox, second)["attempts"] == 0
+
+    # Not due yet: only the released message goes out
+    assert outbox.deliver_batch() == 1
+    assert message(outbox, first)["status"] == "pending"
+
+    make_due(outbox, first)
+    assert outbox.deliver_batch() == 1
+    assert message(outbox, first)["status"] == "sent"
+    assert len(smtp.received) == 2
+
+
+def test_backoff_doubles_then_gives_up(outbox, smtp):
+    message_id, = queue(outbox, 1)
+    smtp.reject = 3
+
+    delays = []
+    for _ in range(2):
+        before = datetime.utcnow()
+        outbox.deliver_batch()
+        delays.append((message(outbox, message_id)["next_attempt_at"] - before).total_seconds())
+        make_due(outbox, message_id)
+    assert 29 <= delays[0] <= 31
+    assert 59 <= delays[1] <= 61
+
+    outbox.deliver_batch()
+    doc = message(outbox, message_id)
+    assert doc["status"] == "failed"
+    assert doc["attempts"] == 3
+    assert "body" not in doc
+    assert smtp.received == []
+
+
+def test_delivered_message_is_not_resent_when_marking_fails(outbox, smtp, monkeypatch):
+    first, second = queue(outbox, 2)
+    mark_sent = outbox._mark_sent
+    failures = [RuntimeError("MongoDB unavailable")]
+
+    def flaky_mark_sent(doc):
+        if failures:
+            raise failures.pop()
+        mark_sent(doc)
+
+    monkeypatch.setattr(outbox, "_mark_sent", flaky_mark_sent)
+    assert outbox.deliver_batch() == 2
+    assert len(smtp.received) == 2
+    assert message(outbox, first)["status"] == "sending"
+    assert message(outbox, first)["attempts"] == 0
+
+    # Even once its lease has expired, the message is only marked, not sent again
+    outbox.collection.update_one({"id": first}, {"$set": {"locked_until": datetime.utcnow()}})
+    assert outbox.deliver_batch() == 0
+    assert message(outbox, first)["status"] == "sent"
+    assert message(outbox, second)["status"] == "sent"
+    assert len(smtp.received) == 2
+
+
+def test_stats_are_served_from_cache(outbox):
+    queue(outbox, 2)
+    assert outbox.stats()["pending"] is None
+
+    outbox.refresh_counts()
+    assert outbox.counts() == {"pending": 2, "sending": 0, "failed": 0}
+
+    def unavailable(*args, **kwargs):
+        raise AssertionError("stats() must not query MongoDB")
+
+    outbox.collection.count_documents = unavailable
+    stats = outbox.stats()
+    assert stats["pending"] == 2
+    assert stats["counts_updated_at"]
+
+
+def test_message_reclaimed_by_another_worker_is_not_sent_twice(outbox, smtp, monkeypatch):
+    ids = queue(outbox, 3)
+    other = Outbox(outbox.collection, outbox.mail_factory, outbox.context_factory, rate_per_minute=0,
+                   rate_collection=outbox.rate_collection)
+    other._thread = threading.current_thread()
+    throttle = outbox._throttle
+    takeovers = [True]
+
+    def slow_throttle():
+        # The leases run out while this worker waits for its first send slot
+        if takeovers:
+            takeovers.pop()
+            outbox.collection.update_many({}, {"$set": {"locked_until": datetime.utcnow()}})
+            assert other.deliver_batch() == 3
+        throttle()
+
+    monkeypatch.setattr(outbox, "_throttle", slow_throttle)
+    assert outbox.deliver_batch() == 0
+    assert len(smtp.received) == 3
+    for message_id in ids:
+        assert message(outbox, message_id)["status"] == "sent"
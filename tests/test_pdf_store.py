@@ -0,0 +1,64 @@
+"""
+Local PDF store: LRU eviction, shared directory bound and legacy files.
+"""
+import os
+import time
+import uuid
+
+from pdf_store import LocalPdfStore
+
+
+def key(n):
+    return f"{n:064x}"
+
+
+def stored(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pdf"))
+
+
+def test_least_recently_used_is_evicted_first(tmp_path):
+    store = LocalPdfStore(str(tmp_path), max_bytes=300)
+    for n in range(3):
+        store.put(key(n), b"x" * 100)
+    # Reading 0 makes 1 the least recently used
+    assert store.get_path(key(0))
+
+    store.put(key(3), b"x" * 100)
+    assert store.get_path(key(1)) is None
+    assert stored(tmp_path) == [f"{key(n)}.pdf" for n in (0, 2, 3)]
+    assert store.stats()["evictions"] == 1
+    assert store.stats()["bytes"] == 300
+
+
+def test_newest_object_is_kept_even_when_larger_than_the_bound(tmp_path):
+    store = LocalPdfStore(str(tmp_path), max_bytes=100)
+    store.put(key(0), b"x" * 50)
+    store.put(key(1), b"x" * 500)
+    assert stored(tmp_path) == [f"{key(1)}.pdf"]
+
+
+def test_bound_holds_for_workers_sharing_the_directory(tmp_path):
+    first = LocalPdfStore(str(tmp_path), max_bytes=300, rescan_seconds=0)
+    second = LocalPdfStore(str(tmp_path), max_bytes=300, rescan_seconds=0)
+    for n in range(6):
+        (first if n % 2 else second).put(key(n), b"x" * 100)
+        # Recency comes from mtimes, which need to differ
+        time.sleep(0.01)
+    assert stored(tmp_path) == [f"{key(n)}.pdf" for n in (3, 4, 5)]
+
+
+def test_files_of_a_previous_run_are_indexed_by_recency(tmp_path):
+    for n in range(3):
+        path = tmp_path / f"{key(n)}.pdf"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + n, 1000 + n))
+    store = LocalPdfStore(str(tmp_path), max_bytes=200)
+    assert stored(tmp_path) == [f"{key(n)}.pdf" for n in (1, 2)]
+    assert store.get_path(key(2))
+
+
+def test_legacy_per_id_files_are_removed(tmp_path):
+    (tmp_path / f"{uuid.uuid4()}.pdf").write_bytes(b"old")
+    (tmp_path / "notes.txt").write_bytes(b"kept")
+    LocalPdfStore(str(tmp_path), max_bytes=1000)
+    assert sorted(os.listdir(tmp_path)) == ["notes.txt"]
@@ -0,0 +1,108 @@
+"""
+In-memory revocation index, and the MongoDB fallback used when it cannot vouch for a diploma.
+"""
+import uuid
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import revocation_index
+from revocation_index import BloomFilter, RevocationIndex, _key
+
+
+@pytest.fixture
+def diplomas():
+    return mongomock.MongoClient().lowtechdiploma.diplomas
+
+
+def loaded_index(collection):
+    index = RevocationIndex(collection)
+    # Loaded by the test, not by the background thread
+    index._thread = object()
+    index._load()
+    return index
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    keys = [_key(str(uuid.uuid4())) for _ in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    others = [_key(str(uuid.uuid4())) for _ in range(1000)]
+    # About 1% false positives at capacity
+    assert sum(key in bloom for key in others) < 50
+
+
+def test_status_of_loaded_diplomas(diplomas):
+    ids = [str(uuid.uuid4()) for _ in range(50)]
+    diplomas.insert_many([{"id": diploma_id, "revoked": n % 10 == 0} for n, diploma_id in enumerate(ids)])
+    # Ids that are not UUIDs are hashed to a key
+    diplomas.insert_one({"id": "legacy-1", "revoked": False})
+    index = loaded_index(diplomas)
+
+    assert [index.status(diploma_id) for diploma_id in ids[:3]] == ["revoked", "valid", "valid"]
+    assert index.status("legacy-1") == "valid"
+    assert index.status(str(uuid.uuid4())) == "unknown"
+    # Keys are kept sorted for the binary search
+    base = index._base
+    keys = [base[i:i + 16] for i in range(0, len(base), 16)]
+    assert keys == sorted(keys) and len(keys) == 51
+
+
+def test_additions_are_found_before_and_after_compaction(diplomas, monkeypatch):
+    monkeypatch.setattr(revocation_index, "COMPACT_THRESHOLD", 5)
+    index = loaded_index(diplomas)
+    ids = [str(uuid.uuid4()) for _ in range(12)]
+    for diploma_id in ids[:4]:
+        index.add(diploma_id)
+    assert index._recent and not index._base
+    for diploma_id in ids[4:]:
+        index.add(diploma_id)
+    index.revoke(ids[0])
+
+    assert len(index._base) // 16 >= 5
+    assert index.status(ids[0]) == "revoked"
+    assert all(index.status(diploma_id) == "valid" for diploma_id in ids[1:])
+    assert index.stats()["diplomas"] == 12
+
+
+def test_status_is_none_while_loading(diplomas):
+    index = RevocationIndex(diplomas)
+    index._thread = object()
+    assert index.status(str(uuid.uuid4())) is None
+
+
+# -----------------------------
+# MONGODB FALLBACK (app.py)
+# -----------------------------
+def issue(client, school):
+    response = client.post("/issue", headers=school, json={
+        "student_name": f"student-{uuid.uuid4().hex[:8]}",
+        "student_email": "student@example.org",
+        "degree_name": "Master"
+    })
+    return response.get_json()["diploma_id"]
+
+
+def test_states_come_from_mongodb_while_the_index_is_loading(server, client, school, monkeypatch):
+    valid, revoked = issue(client, school), issue(client, school)
+    client.post("/revoke", headers=school, json={"id": revoked})
+    index = RevocationIndex(server.diplomas_collection)
+    index._thread = object()
+    monkeypatch.setattr(server, "revocation_index", index)
+
+    assert server.diploma_states([valid, revoked, str(uuid.uuid4())]) == {valid: False, revoked: True}
+
+
+def test_revoked_download_link_is_refused_without_the_index(server, client, school):
+    assert server.revocation_index is None
+    diploma_id = issue(client, school)
+    diploma = server.diplomas_collection.find_one({"id": diploma_id}, {"_id": 0})
+    link = server.diploma_download_link(diploma)
+    path = link[link.index("/dl/"):]
+
+    assert client.get(path).status_code == 200
+    client.post("/revoke", headers=school, json={"id": diploma_id})
+    assert client.get(path).status_code == 410
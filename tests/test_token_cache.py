@@ -0,0 +1,38 @@
+"""
+Cache of verified login tokens: expiry and bound.
+"""
+import time
+
+from token_cache import TokenCache
+
+
+def test_claims_are_returned_until_the_token_expires(monkeypatch):
+    cache = TokenCache()
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    claims = {"username": "school", "role": "school", "exp": 1060}
+
+    cache.put("token", claims)
+    assert cache.get("token") == claims
+
+    now[0] = 1060.0
+    assert cache.get("token") is None
+    # Dropped, not only hidden
+    assert cache.stats()["entries"] == 0
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_least_recently_used_token_is_dropped():
+    cache = TokenCache(max_entries=2)
+    for name in ("a", "b"):
+        cache.put(name, {"username": name})
+    assert cache.get("a")
+    cache.put("c", {"username": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+
+
+def test_zero_entries_disables_the_cache():
+    cache = TokenCache(max_entries=0)
+    cache.put("token", {"username": "school"})
+    assert cache.get("token") is None
@@ -0,0 +1,62 @@
+"""
+Cache of decoded authentication tokens.
+
+The frontend sends the same 24-hour JWT with every call. Once its signature
+has been checked, its claims are kept in a bounded LRU keyed by a SHA-256 of
+the token string, so later calls skip the HMAC verification. Entries are
+dropped as soon as the token's ``exp`` has passed.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """LRU of ``token hash -> (claims, exp)`` for verified tokens."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Claims of a previously verified, unexpired token, or None."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, exp = entry
+                if exp is None or time.time() < exp:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                # Expired: let the caller decode it again and report the expiry
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        """Remember the claims of a token whose signature was just verified."""
+        if self.max_entries <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, claims.get("exp"))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries
+        }
@@ -0,0 +1,93 @@
+"""
+Streaming ZIP archives.
+
+Archives are produced incrementally with :mod:`zipfile` writing into a small
+buffer that is drained between entries, so a response can start before the
+archive is complete and a worker never holds more than one entry (a JSON
+document or a PDF) in memory.
+
+Each entry stays in the buffer until it is complete, so that zipfile can go
+back and fill in its local header (sizes and CRC). Entries therefore carry no
+data descriptor, which some readers (e.g. Java's ``ZipInputStream``) refuse
+for stored entries.
+"""
+import zipfile
+from datetime import datetime
+from urllib.parse import quote
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkWriter:
+    """Sink that can only seek within the bytes not yet handed out by :meth:`take`."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0      # archive offset of buffer[0]
+        self.position = 0
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=0):
+        if whence != 0 or position < self.offset:
+            raise OSError("Cannot seek into bytes already sent")
+        self.position = position
+        return position
+
+    def write(self, data):
+        start = self.position - self.offset
+        self.buffer[start:start + len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.offset += len(data)
+        self.buffer.clear()
+        return data
+
+
+def file_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Read a file lazily in ``chunk_size`` pieces."""
+    with open(path, 'rb') as fp:
+        while True:
+            data = fp.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+
+def stream_zip(entries, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield a ZIP archive in chunks of at least ``chunk_size`` bytes, made of whole entries.
+
+    ``entries`` is an iterable of ``(name, chunks, compress)`` where ``chunks``
+    is bytes or an iterable of bytes. Entries with ``compress=False`` (e.g.
+    PDFs, which are already compressed) are stored as-is.
+    """
+    sink = _ChunkWriter()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for name, chunks, compress in entries:
+            info = zipfile.ZipInfo(name, date_time=datetime.utcnow().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            if isinstance(chunks, (bytes, bytearray)):
+                chunks = [chunks]
+            with zf.open(info, 'w') as dest:
+                for data in chunks:
+                    dest.write(data)
+            # Only between entries: the header of the current one is rewritten when it closes
+            if len(sink.buffer) >= chunk_size:
+                yield sink.take()
+    # Central directory
+    yield sink.take()
+
+
+def attachment_headers(filename):
+    """Content-Disposition header for a download, safe for non-ASCII names."""
+    ascii_name = filename.encode('ascii', 'ignore').decode().replace('"', '') or 'download'
+    return {
+        "Content-Disposition": f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+    }